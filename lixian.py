@@ -9,6 +9,7 @@ from tkinter import ttk, filedialog, scrolledtext, messagebox
 from urllib.parse import urljoin, urlparse, unquote
 from io import BytesIO
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 from fake_useragent import UserAgent
 from PIL import Image
@@ -191,6 +192,91 @@ class WebDownloaderGUI:
         if self.auto_open_var.get():
             self.open_file_explorer(self.current_task_dir)
 
+# ================= 连接池 =================
+
+class _CountingPoolMixin:
+    """统计连接取用/新建次数的 urllib3 连接池混入类"""
+    stats = None
+
+    def _get_conn(self, timeout=None):
+        self.stats.record_checkout()
+        return super()._get_conn(timeout)
+
+    def _new_conn(self):
+        self.stats.record_new_conn()
+        return super()._new_conn()
+
+class _CountingAdapter(HTTPAdapter):
+    """把计数连接池挂到 PoolManager 上的 HTTPAdapter"""
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        # pool_classes_by_scheme 默认指向模块级字典，这里换成新字典避免污染全局
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: type(f"Counting{base.__name__}", (_CountingPoolMixin, base), {'stats': self.stats})
+            for scheme, base in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+class SessionPool:
+    """任务级 HTTP 连接池
+
+    所有线程共享同一个 HTTPAdapter（底层 urllib3 连接池是线程安全的），
+    每个线程各自持有一个 requests.Session，避免跨线程共享 Session 状态。
+    """
+    def __init__(self, pool_size=6, max_hosts=32):
+        self.pool_size = pool_size
+        self.checkouts = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._sessions = []
+        self.adapter = _CountingAdapter(self, pool_connections=max_hosts, pool_maxsize=pool_size)
+
+    def record_checkout(self):
+        with self._lock:
+            self.checkouts += 1
+
+    def record_new_conn(self):
+        with self._lock:
+            self.misses += 1
+
+    @property
+    def hits(self):
+        return max(self.checkouts - self.misses, 0)
+
+    @property
+    def session(self):
+        """返回当前线程专属的 Session（首次访问时创建）"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.verify = False
+            session.headers['Connection'] = 'keep-alive'
+            session.mount('http://', self.adapter)
+            session.mount('https://', self.adapter)
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def get(self, url, **kwargs):
+        return self.session.get(url, **kwargs)
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = (self.hits / total * 100) if total else 0.0
+        return f"🔌 连接池统计: 复用 {self.hits} 次, 新建 {self.misses} 次 (命中率 {rate:.1f}%)"
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
+        self.adapter.close()
+
 # ================= 核心下载逻辑 (保持不变) =================
 
 class CoreDownloader:
@@ -204,9 +290,11 @@ class CoreDownloader:
         self.target_img_fmt = params['target_fmt']
         self.allow_img = params['filter_img']
         self.allow_video = params['filter_video']
-        
+        self.max_workers = params.get('max_workers', 6)
+
         self.ua = UserAgent()
         self.visited_urls = set()
+        self.http = SessionPool(pool_size=self.max_workers)
         
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
@@ -250,25 +338,24 @@ class CoreDownloader:
             if os.path.exists(local_path): return relative_path
 
             self.log(f"   ⬇️ {filename}")
-            resp = requests.get(url, headers=self.get_headers(), stream=True, timeout=10, verify=False)
-            
-            if resp.status_code == 200:
-                if is_img and self.convert_images:
-                    try:
-                        img = Image.open(BytesIO(resp.content))
-                        fname_no_ext = os.path.splitext(filename)[0]
-                        new_fname = f"{fname_no_ext}.{self.target_img_fmt.lower()}"
-                        local_path = os.path.join(folder_path, new_fname)
-                        if img.mode in ("RGBA", "P"): img = img.convert("RGB")
-                        img.save(local_path, self.target_img_fmt)
-                        return f"{sub_folder}/{new_fname}"
-                    except:
-                        pass 
-
-                with open(local_path, 'wb') as f:
-                    for chunk in resp.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                return relative_path
+            with self.http.get(url, headers=self.get_headers(), stream=True, timeout=10) as resp:
+                if resp.status_code == 200:
+                    if is_img and self.convert_images:
+                        try:
+                            img = Image.open(BytesIO(resp.content))
+                            fname_no_ext = os.path.splitext(filename)[0]
+                            new_fname = f"{fname_no_ext}.{self.target_img_fmt.lower()}"
+                            local_path = os.path.join(folder_path, new_fname)
+                            if img.mode in ("RGBA", "P"): img = img.convert("RGB")
+                            img.save(local_path, self.target_img_fmt)
+                            return f"{sub_folder}/{new_fname}"
+                        except:
+                            pass 
+
+                    with open(local_path, 'wb') as f:
+                        for chunk in resp.iter_content(chunk_size=8192):
+                            f.write(chunk)
+                    return relative_path
         except Exception:
             pass
         return None
@@ -280,7 +367,7 @@ class CoreDownloader:
         self.log(f"🌍 分析页面 [深度{depth}]: {url}")
         try:
             requests.packages.urllib3.disable_warnings()
-            resp = requests.get(url, headers=self.get_headers(), verify=False, timeout=10)
+            resp = self.http.get(url, headers=self.get_headers(), timeout=10)
             if resp.status_code != 200: return
             
             soup = BeautifulSoup(resp.text, 'lxml')
@@ -325,7 +412,11 @@ class CoreDownloader:
             self.log(f"❌ 页面错误: {e}")
 
     def start(self):
-        self.process_page(self.start_url, 0)
+        try:
+            self.process_page(self.start_url, 0)
+        finally:
+            self.log(self.http.summary())
+            self.http.close()
 
 # ================= 启动 =================
 
@@ -0,0 +1,195 @@
+"""离线网页下载器 - 命令行版
+
+不需要图形界面，适合在服务器或批处理任务中使用。与图形界面共用 lixian_core 中的下载引擎。
+
+示例:
+    python lixian_cli.py https://example.com -d 2
+    python lixian_cli.py -i urls.txt -o ./archive -j 4
+    cat urls.txt | python lixian_cli.py -i -
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import traceback
+import concurrent.futures
+
+from lixian_core import DownloadSink, TransferBudget, TaskControl, TRACKING_PARAMS, create_downloader, open_task_dir, aiohttp
+
+
+class ConsoleSink(DownloadSink):
+    """把引擎事件打印到终端，多个任务并发时在每行前加上任务编号"""
+    _print_lock = threading.Lock()
+
+    def __init__(self, label="", quiet=False, verbose=False):
+        self.label = label
+        self.quiet = quiet
+        self.verbose = verbose
+
+    def emit(self, msg, stream=sys.stdout):
+        prefix = f"[{self.label}] " if self.label else ""
+        with self._print_lock:
+            for line in str(msg).strip('\n').split('\n'):
+                print(f"{prefix}{line}", file=stream, flush=True)
+
+    def log(self, msg, tag="info"):
+        # 安静模式下不输出逐文件日志
+        if self.quiet and tag == "file": return
+        self.emit(msg, sys.stderr if tag == "error" else sys.stdout)
+
+    def error(self, title, message, details):
+        if self.verbose: self.emit(details, sys.stderr)
+
+    def progress(self, event, **info):
+        if event == 'finished':
+            self.emit(f"📦 完成: {info['pages']} 个页面, {info['files']} 个资源 -> {info['output_dir']}")
+
+
+def read_urls(args):
+    """合并命令行参数和 -i 指定的文件（- 表示标准输入）中的网址，去重并保持顺序"""
+    urls = list(args.urls)
+    if args.input:
+        f = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+        try:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    urls.append(line)
+        finally:
+            if f is not sys.stdin: f.close()
+
+    result = []
+    for url in urls:
+        if not url.startswith(('http://', 'https://')):
+            url = 'https://' + url
+        if url not in result:
+            result.append(url)
+    return result
+
+
+def build_params(args, url, output_dir, budget=None, control=None):
+    """与图形界面 run_logic 中的参数保持一致"""
+    root_dir = os.path.abspath(args.output)
+    return {
+        'url': url,
+        'output_dir': output_dir,
+        'depth': args.depth,
+        'mode': args.mode,
+        'filter_img': not args.no_img,
+        'filter_video': not args.no_video,
+        'convert_img': bool(args.convert),
+        'target_fmt': args.convert or 'PNG',
+        'img_quality': args.quality,
+        'img_max_dim': args.max_dim,
+        'img_keep_smaller': not args.allow_larger,
+        'image_variants': 'all' if args.all_variants else 'largest',
+        'max_workers': max(1, args.workers),
+        'cache_dir': None if args.no_cache else os.path.join(root_dir, ".http_cache"),
+        'store_dir': os.path.join(root_dir, ".asset_store"),
+        'parser': args.parser,
+        'max_pages': args.max_pages,
+        'max_bytes': int(args.max_mb * 1024 * 1024),
+        'max_file_size': int(args.max_file_mb * 1024 * 1024),
+        'time_limit': args.time_limit * 60,
+        'url_rules': url_rules(args),
+        'host_rate': args.host_rate,
+        'origin_rate': args.origin_rate if args.origin_rate is not None else args.host_rate,
+        'budget': budget,
+        'control': control
+    }
+
+
+def url_rules(args):
+    """网址规范化规则，见 lixian_core.UrlCanonicalizer"""
+    strip_params = () if args.keep_query else TRACKING_PARAMS + tuple(args.strip_param)
+    return {
+        'strip_params': strip_params,
+        'sort_query': not args.keep_query,
+        'strip_trailing_slash': args.strip_slash
+    }
+
+
+def run_one(args, url, label, budget, control):
+    sink = ConsoleSink(label, args.quiet, args.verbose)
+    try:
+        output_dir, resumed = open_task_dir(os.path.abspath(args.output), url, not args.no_resume)
+        sink.log(f"♻️ 继续未完成的任务目录: {output_dir}" if resumed else f"📂 创建任务目录: {output_dir}", "info")
+        create_downloader(build_params(args, url, output_dir, budget, control), sink, args.engine).start()
+        return True
+    except Exception as e:
+        sink.log(f"❌ 发生错误: {e}", "error")
+        if args.verbose: sink.emit(traceback.format_exc(), sys.stderr)
+        return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="离线网页下载器 - 命令行版")
+    parser.add_argument('urls', nargs='*', help="要下载的网址")
+    parser.add_argument('-i', '--input', help="网址列表文件，每行一个，- 表示从标准输入读取")
+    parser.add_argument('-o', '--output', default="downloads", help="保存路径 (默认: downloads)")
+    parser.add_argument('-d', '--depth', type=int, default=0, help="爬取深度，0 表示仅本页 (默认: 0)")
+    parser.add_argument('-m', '--mode', choices=["full", "media_only"], default="full", help="下载模式 (默认: full)")
+    parser.add_argument('--max-pages', type=int, default=0, help="每个网址最多抓取的页面数，0 表示不限 (默认: 0)")
+    parser.add_argument('--max-mb', type=float, default=0, help="每个网址最多下载的总流量 MB，0 表示不限 (默认: 0)")
+    parser.add_argument('--max-file-mb', type=float, default=0, help="单个文件的大小上限 MB，超过的不下载，0 表示不限 (默认: 0)")
+    parser.add_argument('--time-limit', type=float, default=0, help="每个网址的最长用时（分钟），0 表示不限 (默认: 0)")
+    parser.add_argument('-j', '--jobs', type=int, default=2, help="同时下载的网址数 (默认: 2)")
+    parser.add_argument('-w', '--workers', type=int, default=6, help="每个网址的并发线程数 (默认: 6)")
+    parser.add_argument('--rate', type=int, default=0, help="所有任务共享的总带宽上限 KB/s，0 表示不限 (默认: 0)")
+    parser.add_argument('--host-rate', type=float, default=0, help="每个主机每秒最多发起的请求数，0 表示不限 (默认: 0)")
+    parser.add_argument('--origin-rate', type=float, help="起始页所在主机每秒最多发起的请求数 (默认同 --host-rate)")
+    parser.add_argument('--engine', choices=["thread", "async"], default="thread", help="下载引擎 (默认: thread)")
+    parser.add_argument('--parser', choices=["lxml", "bs4"], default="lxml", help="HTML 解析器 (默认: lxml)")
+    parser.add_argument('--convert', choices=["PNG", "JPG", "WEBP"], help="把图片转换为指定格式")
+    parser.add_argument('--quality', type=int, default=85, help="JPG/WEBP 编码质量 1-100 (默认: 85)")
+    parser.add_argument('--max-dim', type=int, default=0, help="把图片缩小到最长边不超过该像素数，0 表示不缩放")
+    parser.add_argument('--allow-larger', action='store_true', help="重新编码后变大时也使用新文件（默认保留原图）")
+    parser.add_argument('--all-variants', action='store_true', help="下载 srcset/<picture> 中的全部尺寸（默认只下载最大的一个）")
+    parser.add_argument('--no-img', action='store_true', help="不下载图片")
+    parser.add_argument('--no-video', action='store_true', help="不下载视频")
+    parser.add_argument('--no-cache', action='store_true', help="不使用跨任务 HTTP 缓存")
+    parser.add_argument('--strip-param', action='append', default=[], metavar='NAME',
+                        help="去重时额外忽略的查询参数，可多次指定，以 _ 结尾表示前缀 (默认已忽略 utm_*、spm 等)")
+    parser.add_argument('--keep-query', action='store_true', help="去重时保留全部查询参数及其顺序")
+    parser.add_argument('--strip-slash', action='store_true', help="把 /page/ 和 /page 视为同一个页面")
+    parser.add_argument('--no-resume', action='store_true', help="总是新建任务目录，不继续未完成的任务")
+    parser.add_argument('-q', '--quiet', action='store_true', help="不输出逐文件日志")
+    parser.add_argument('-v', '--verbose', action='store_true', help="出错时输出完整堆栈")
+    args = parser.parse_args(argv)
+
+    urls = read_urls(args)
+    if not urls:
+        parser.error("请提供至少一个网址，或使用 -i 指定网址列表")
+    if args.engine == "async" and aiohttp is None:
+        parser.error("异步引擎需要 aiohttp，请先执行: pip install aiohttp")
+
+    started = time.time()
+    jobs = max(1, min(args.jobs, len(urls)))
+    # 同时运行的任务共享连接数和带宽预算
+    per_task = max(1, args.workers) if args.engine == "thread" else 1000
+    budget = TransferBudget(per_task * jobs, args.rate * 1024)
+    control = TaskControl()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(run_one, args, url, str(i + 1) if len(urls) > 1 else "", budget, control)
+                   for i, url in enumerate(urls)]
+        try:
+            concurrent.futures.wait(futures)
+        except KeyboardInterrupt:
+            # Ctrl+C：排队的网址不再开始，运行中的任务保留断点后结束，再按一次强制退出
+            print("⏹️ 正在停止，未完成的任务下次运行时继续...", file=sys.stderr, flush=True)
+            control.cancel()
+            executor.shutdown(cancel_futures=True)
+
+    results = [f.result() for f in futures if not f.cancelled()]
+    failed = results.count(False)
+    if control.cancelled:
+        print(f"⏹️ 已停止: 结束 {len(results)} 个, 未开始 {len(urls) - len(results)} 个, "
+              f"耗时 {time.time() - started:.1f}s", flush=True)
+        return 130
+    print(f"✨ 全部完成: 成功 {len(urls) - failed} 个, 失败 {failed} 个, 耗时 {time.time() - started:.1f}s", flush=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,3501 @@
+"""离线网页下载器核心引擎
+
+不依赖 tkinter，可以被图形界面 (lixian_gui_beautified.py) 和
+命令行 (lixian_cli.py) 共同使用。日志、进度和错误通过 DownloadSink 回报。
+"""
+import os
+import posixpath
+import re
+import time
+import threading
+from urllib.parse import (urljoin, urlparse, urlunparse, urlsplit, urlunsplit, unquote, unquote_plus,
+                          parse_qsl, urlencode)
+import requests
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
+import lxml.html
+from lxml import etree
+from fake_useragent import UserAgent
+from PIL import Image, ImageOps
+import concurrent.futures
+import queue
+from collections import deque
+import traceback
+import asyncio
+import hashlib
+import shutil
+import sqlite3
+import codecs
+import uuid
+import mimetypes
+import contextlib
+import json
+import email.utils
+import random
+import socket
+import bisect
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# ================= 事件回报接口 =================
+
+class DownloadSink:
+    """下载引擎向外回报日志、进度和错误的接口
+
+    默认实现把日志打印到标准输出；图形界面和命令行各自继承并覆盖需要的方法。
+    这些方法会在工作线程或事件循环中被调用，实现需要自行保证线程安全。
+    """
+    def log(self, msg, tag="info"):
+        print(msg, flush=True)
+
+    def progress(self, event, **info):
+        """进度事件:
+        page_saved (url, path) / file_saved (url, path) / finished (output_dir, pages, files)
+        """
+
+    def error(self, title, message, details):
+        """严重错误（例如网络不可达），details 为完整堆栈"""
+
+
+def make_task_dir(root_dir, url):
+    """按 "域名_时间戳" 生成任务目录路径，同一秒内重名时追加序号"""
+    domain_name = urlparse(url).netloc.replace("www.", "")
+    base = os.path.join(root_dir, f"{domain_name}_{time.strftime('%Y%m%d_%H%M%S')}")
+    path, index = base, 1
+    while True:
+        # 直接尝试创建：并发任务可能在同一秒内为同一域名建目录，先检查再创建会撞车
+        try:
+            os.makedirs(path)
+            return path
+        except FileExistsError:
+            index += 1
+            path = f"{base}_{index}"
+
+
+def open_task_dir(root_dir, url, resume=True, exclude=()):
+    """返回 (任务目录, 是否续传)：resume 为真时优先使用同一网址未完成的任务目录
+
+    exclude 为正在运行的任务目录，不会被重复使用。
+    """
+    if resume:
+        task_dir = CrawlJournal.find_unfinished(root_dir, url, exclude)
+        if task_dir: return task_dir, True
+    return make_task_dir(root_dir, url), False
+
+
+def create_downloader(params, sink=None, engine="thread"):
+    """按引擎名创建下载器，engine 为 thread（多线程）或 async（asyncio）"""
+    if engine == "async":
+        return AsyncCoreDownloader(params, sink)
+    return CoreDownloader(params, sink)
+
+# ================= 连接池 =================
+
+class _CountingPoolMixin:
+    """统计连接取用/新建次数的 urllib3 连接池混入类
+
+    连接对象可能被重复使用：响应没有读完就关闭时套接字断开，下次取出时重新连接。
+    因此“新建”按实际打开套接字的次数统计，而不是按创建连接对象的次数。
+    """
+    stats = None
+
+    def _get_conn(self, timeout=None):
+        self.stats.record_checkout()
+        return super()._get_conn(timeout)
+
+    def _new_conn(self):
+        conn = super()._new_conn()
+        # 连接在第一次请求时才真正建立：分别计时 TCP 连接（含 DNS 解析）和之后的 TLS 握手
+        record, https = self.stats.record_connect, self.scheme == 'https'
+        open_socket, connect = conn._new_conn, conn.connect
+        socket_time = [0.0]
+
+        def timed_socket():
+            self.stats.record_new_conn()
+            t0 = time.perf_counter()
+            try:
+                return open_socket()
+            finally:
+                socket_time[0] = time.perf_counter() - t0
+                record('tcp_connect', socket_time[0])
+
+        def timed_connect():
+            t0 = time.perf_counter()
+            try:
+                return connect()
+            finally:
+                if https: record('tls_handshake', time.perf_counter() - t0 - socket_time[0])
+
+        conn._new_conn, conn.connect = timed_socket, timed_connect
+        return conn
+
+class _CountingAdapter(HTTPAdapter):
+    """把计数连接池挂到 PoolManager 上的 HTTPAdapter"""
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        # pool_classes_by_scheme 默认指向模块级字典，这里换成新字典避免污染全局
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: type(f"Counting{base.__name__}", (_CountingPoolMixin, base), {'stats': self.stats})
+            for scheme, base in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+class SessionPool:
+    """任务级 HTTP 连接池
+
+    所有线程共享同一个 HTTPAdapter（底层 urllib3 连接池是线程安全的），
+    每个线程各自持有一个 requests.Session，避免跨线程共享 Session 状态。
+    """
+    def __init__(self, pool_size=6, max_hosts=32, on_connect=None):
+        self.pool_size = pool_size
+        # on_connect(phase, seconds) 接收建立连接各阶段的耗时
+        self.on_connect = on_connect or (lambda phase, seconds: None)
+        self.checkouts = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._sessions = []
+        self.adapter = _CountingAdapter(self, pool_connections=max_hosts, pool_maxsize=pool_size)
+
+    def record_checkout(self):
+        with self._lock:
+            self.checkouts += 1
+
+    def record_new_conn(self):
+        with self._lock:
+            self.misses += 1
+
+    def record_connect(self, phase, seconds):
+        self.on_connect(phase, seconds)
+
+    @property
+    def hits(self):
+        return max(self.checkouts - self.misses, 0)
+
+    @property
+    def session(self):
+        """返回当前线程专属的 Session（首次访问时创建）"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.verify = False
+            session.headers['Connection'] = 'keep-alive'
+            session.mount('http://', self.adapter)
+            session.mount('https://', self.adapter)
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def get(self, url, **kwargs):
+        return self.session.get(url, **kwargs)
+
+    DRAIN_LIMIT = 64 * 1024   # 关闭前读完剩余响应体以复用连接的上限（字节）
+
+    @contextlib.contextmanager
+    def stream(self, url, **kwargs):
+        """流式 GET；正常离开时先把连接交还连接池再关闭响应"""
+        with self.get(url, stream=True, **kwargs) as resp:
+            yield resp
+            self.release(resp)
+
+    def release(self, resp):
+        """读完剩余的较小响应体（如 304、被过滤资源的响应），让连接回到连接池
+
+        未读完的响应直接关闭会断开连接，下一个请求只能重新建立。
+        剩余部分较大或长度未知时仍然断开，避免为了复用连接多传输数据。
+        """
+        raw = resp.raw
+        remaining = getattr(raw, 'length_remaining', None)
+        if remaining is None or remaining > self.DRAIN_LIMIT: return
+        try:
+            raw.read(decode_content=False)
+        except Exception:
+            return
+        raw.release_conn()
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = (self.hits / total * 100) if total else 0.0
+        return f"🔌 连接池统计: 复用 {self.hits} 次, 新建 {self.misses} 次 (命中率 {rate:.1f}%)"
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
+        self.adapter.close()
+
+def abort_response(resp):
+    """从其他线程中止流式响应：关闭套接字的读写，阻塞在读取上的线程立即返回而不必等读超时"""
+    sock = getattr(getattr(resp.raw, '_connection', None), 'sock', None)
+    if sock is None: return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+# ================= 全局传输预算 =================
+
+class TransferBudget:
+    """多个任务共享的连接数和带宽预算
+
+    max_connections 为所有任务同时进行的请求数上限；
+    max_rate 为总带宽上限（字节/秒），0 表示不限速。
+    """
+    POLL_INTERVAL = 0.05   # 异步引擎等待连接名额时的最长轮询间隔（秒）
+
+    def __init__(self, max_connections, max_rate=0):
+        self.max_connections = max_connections
+        self.max_rate = max_rate
+        self._connections = threading.BoundedSemaphore(max_connections)
+        self._rate_lock = threading.Lock()
+        self._next_free = time.monotonic()
+
+    @contextlib.contextmanager
+    def connection(self):
+        with self._connections:
+            yield
+
+    @contextlib.asynccontextmanager
+    async def async_connection(self):
+        # 线程信号量不能在事件循环中阻塞等待，拿不到时在事件循环里轮询：
+        # 不占用线程池的线程，协程在等待中被取消时也不会留下已拿到却没人归还的名额
+        delay = 0.005
+        while not self._connections.acquire(blocking=False):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.POLL_INTERVAL)
+        try:
+            yield
+        finally:
+            self._connections.release()
+
+    def reserve(self, nbytes):
+        """登记即将传输的字节数，返回为了不超过带宽上限需要等待的秒数"""
+        if not self.max_rate: return 0
+        with self._rate_lock:
+            now = time.monotonic()
+            start = max(now, self._next_free)
+            self._next_free = start + nbytes / self.max_rate
+            return start - now
+
+    def throttle(self, nbytes, sleep=time.sleep):
+        """按带宽上限等待；sleep 可以换成可被打断的等待（如 TaskControl.sleep），被打断时返回 False"""
+        delay = self.reserve(nbytes)
+        return delay <= 0 or sleep(delay) is not False
+
+    async def throttle_async(self, nbytes):
+        delay = self.reserve(nbytes)
+        if delay > 0: await asyncio.sleep(delay)
+
+# ================= 按主机的并发控制 =================
+
+def parse_retry_after(value):
+    """解析 Retry-After 响应头（秒数或 HTTP 日期），返回需要等待的秒数，无法解析时返回 None"""
+    if not value: return None
+    value = value.strip()
+    if value.isdigit(): return float(value)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class _HostState:
+    """单个主机的并发上限、令牌桶和延迟统计"""
+    def __init__(self, host, origin, limit, max_limit, rate):
+        self.host = host
+        self.origin = origin
+        self.limit = limit
+        self.start_limit = limit
+        self.peak = limit
+        self.max_limit = max_limit
+        self.rate = rate
+        self.tokens = 1.0
+        self.refilled = time.monotonic()
+        self.active = 0
+        self.dispatched = 0      # 线程引擎中已交给线程池、尚未结束的工作数
+        self.waiting = deque()   # 等待交给线程池的工作（见 HostController.dispatch）
+        self.paused_until = 0.0
+        self.backoff_at = 0.0
+        self.latency = None      # 响应延迟的指数滑动平均
+        self.baseline = None     # 观察到的最低平均延迟
+        self.streak = 0
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+
+class HostSlot:
+    """一次请求占用的主机名额，收到响应头后调用 done() 回报状态码"""
+    def __init__(self, controller, state):
+        self.controller = controller
+        self.state = state
+        self.started = time.monotonic()
+        self.reported = False
+
+    def done(self, status, headers=None, latency=None):
+        if self.reported: return
+        self.reported = True
+        if latency is None: latency = time.monotonic() - self.started
+        retry_after = parse_retry_after(headers.get('Retry-After')) if headers else None
+        self.controller.record(self.state, status, latency, retry_after)
+
+class HostController:
+    """按主机的礼貌限速和自适应并发控制
+
+    每个主机有一个令牌桶（请求/秒，0 表示不限）和一个并发上限：
+    延迟保持平稳时，每连续成功 limit 次请求上限加 1；平均延迟明显高于
+    基线时减 1；遇到 429/503 或连接错误时减半，并按 Retry-After 暂停该主机。
+    起始页所在的源站与其他主机（图片/脚本 CDN 等）分开配置，源站起步更保守。
+    """
+    THROTTLE_STATUS = (429, 503)
+    LATENCY_FACTOR = 2.0
+    LATENCY_SLACK = 0.05
+    MAX_PAUSE = 300
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, origin_url, origin_max=6, host_max=16, origin_rate=0, host_rate=0, log=None,
+                 should_stop=None):
+        self.origin = (urlparse(origin_url).netloc or '').lower()
+        # should_stop() 为真时等待名额的请求立即放弃（任务已停止）
+        self.should_stop = should_stop or (lambda: False)
+        self.origin_max = max(1, origin_max)
+        self.host_max = max(1, host_max)
+        self.origin_rate = origin_rate
+        self.host_rate = host_rate
+        self.log = log or (lambda msg, tag="info": None)
+        self.hosts = {}
+        self._cond = threading.Condition(threading.Lock())
+
+    def state(self, url):
+        host = (urlparse(url).netloc or '').lower()
+        with self._cond:
+            st = self.hosts.get(host)
+            if st is None:
+                origin = host == self.origin
+                max_limit = self.origin_max if origin else self.host_max
+                st = self.hosts[host] = _HostState(
+                    host, origin, min(max_limit, 2 if origin else 4), max_limit,
+                    self.origin_rate if origin else self.host_rate)
+            return st
+
+    def _try_acquire(self, st):
+        """持锁调用：拿到名额返回 0，需要等待固定时间返回秒数，等待其他请求释放返回 None"""
+        now = time.monotonic()
+        if now < st.paused_until: return st.paused_until - now
+        if st.active >= st.limit: return None
+        if st.rate:
+            st.tokens = min(max(1.0, st.rate), st.tokens + (now - st.refilled) * st.rate)
+            st.refilled = now
+            if st.tokens < 1: return (1 - st.tokens) / st.rate
+            st.tokens -= 1
+        st.active += 1
+        st.requests += 1
+        return 0
+
+    def _release(self, st):
+        with self._cond:
+            st.active -= 1
+            self._cond.notify_all()
+
+    def _pop_ready(self, st):
+        """持锁调用：按并发上限取出可以开始的等待工作"""
+        ready = []
+        while st.waiting and st.dispatched < st.limit:
+            st.dispatched += 1
+            ready.append(st.waiting.popleft())
+        return ready
+
+    def _start(self, st, ready):
+        while ready:
+            if ready.pop(0)(): continue
+            # 没有交给线程池（任务已停止），名额让给下一个
+            with self._cond:
+                st.dispatched -= 1
+                ready.extend(self._pop_ready(st))
+
+    def dispatch(self, url, start):
+        """线程引擎的按主机排队：该主机进行中的工作未达并发上限时立即调用 start()，
+        否则放进主机自己的等待队列，不占用共享线程池的工作线程。
+
+        start() 把工作提交给线程池并返回 True，没有提交时返回 False；
+        提交的工作结束后必须调用 finished(url)。
+        """
+        st = self.state(url)
+        with self._cond:
+            st.waiting.append(start)
+            ready = self._pop_ready(st)
+        self._start(st, ready)
+
+    def finished(self, url):
+        st = self.state(url)
+        with self._cond:
+            st.dispatched -= 1
+            ready = self._pop_ready(st)
+        self._start(st, ready)
+
+    def wake(self):
+        """唤醒所有等待名额的线程，让它们重新检查 should_stop"""
+        with self._cond:
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, url):
+        st = self.state(url)
+        with self._cond:
+            while True:
+                if self.should_stop(): raise TaskCancelled("任务已停止")
+                wait = self._try_acquire(st)
+                if wait == 0: break
+                self._cond.wait(wait)
+        slot = HostSlot(self, st)
+        try:
+            yield slot
+        except TaskCancelled:
+            # 停止不是主机的问题，不计入连接错误
+            raise
+        except Exception:
+            # 响应头之前就失败的请求（连接错误、超时）按错误处理
+            if not slot.reported: slot.done(None)
+            raise
+        finally:
+            self._release(st)
+
+    @contextlib.asynccontextmanager
+    async def async_slot(self, url):
+        st = self.state(url)
+        while True:
+            if self.should_stop(): raise TaskCancelled("任务已停止")
+            with self._cond:
+                wait = self._try_acquire(st)
+            if wait == 0: break
+            await asyncio.sleep(self.POLL_INTERVAL if wait is None else min(wait, self.POLL_INTERVAL * 10))
+        slot = HostSlot(self, st)
+        try:
+            yield slot
+        except TaskCancelled:
+            raise
+        except Exception:
+            if not slot.reported: slot.done(None)
+            raise
+        finally:
+            self._release(st)
+
+    def record(self, st, status, latency, retry_after=None):
+        with self._cond:
+            now = time.monotonic()
+            if status is None or status in self.THROTTLE_STATUS:
+                if status is None: st.errors += 1
+                else: st.throttled += 1
+                pause = min(retry_after if retry_after is not None else (1.0 if status else 0), self.MAX_PAUSE)
+                st.paused_until = max(st.paused_until, now + pause)
+                st.streak = 0
+                # 同一批并发请求一起失败时只减半一次
+                if now >= st.backoff_at:
+                    st.limit = max(1, st.limit // 2)
+                    st.backoff_at = now + max(1.0, pause)
+                    reason = f"HTTP {status}" if status else "连接错误"
+                    self.log(f"   🚦 {st.host} {reason}，并发降为 {st.limit}"
+                             + (f"，暂停 {pause:.0f}s" if pause >= 1 else ""), "warning")
+                return
+
+            st.latency = latency if st.latency is None else 0.8 * st.latency + 0.2 * latency
+            st.baseline = st.latency if st.baseline is None else min(st.baseline, st.latency)
+            if st.latency > st.baseline * self.LATENCY_FACTOR + self.LATENCY_SLACK:
+                st.streak = 0
+                if now >= st.backoff_at and st.limit > 1:
+                    st.limit -= 1
+                    st.backoff_at = now + st.latency
+                return
+            st.streak += 1
+            if st.streak >= st.limit and st.limit < st.max_limit:
+                st.limit += 1
+                st.peak = max(st.peak, st.limit)
+                st.streak = 0
+                self._cond.notify_all()
+
+    def summary(self, top=5):
+        with self._cond:
+            states = sorted(self.hosts.values(), key=lambda st: (not st.origin, -st.requests))
+        lines = [f"🚦 主机并发: 共 {len(states)} 个主机"]
+        for st in states[:top]:
+            latency = f", 平均延迟 {st.latency * 1000:.0f}ms" if st.latency is not None else ""
+            lines.append(f"   {st.host}{' (源站)' if st.origin else ''}: 请求 {st.requests} 次, "
+                         f"并发 {st.start_limit}→{st.limit} (峰值 {st.peak}){latency}, "
+                         f"限流 {st.throttled} 次, 连接错误 {st.errors} 次")
+        return "\n".join(lines)
+
+# ================= 失败重试与负缓存 =================
+
+class FetchError(Exception):
+    """资源请求失败（非 200 状态码或内容不完整），transient 表示可以重试"""
+    def __init__(self, reason, status=None, transient=False, retry_after=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.status = status
+        self.transient = transient
+        self.retry_after = retry_after
+
+class RangeUnsupported(FetchError):
+    """服务器没有按字节范围返回分段，重试时改为整体下载"""
+    def __init__(self, reason, status=None):
+        super().__init__(reason, status=status, transient=True)
+
+class RetryPolicy:
+    """瞬时错误按带随机抖动的指数退避重试，永久错误和重试用尽的错误记入负缓存
+
+    瞬时错误：连接中断、超时、内容不完整、HTTP 429/5xx；
+    永久错误：其他 4xx（如 404）和 DNS 解析失败。DNS 失败按主机记录，
+    同一任务中该主机的其他资源也不再请求。
+    """
+    RETRY_STATUS = (408, 429, 500, 502, 503, 504)
+
+    def __init__(self, attempts=3, base_delay=0.5, max_delay=30):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.failed_urls = {}
+        self.failed_hosts = {}
+        self.retries = 0
+        self.recovered = 0
+        self.skipped = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def http_error(self, status, headers=None):
+        retry_after = parse_retry_after(headers.get('Retry-After')) if headers else None
+        return FetchError(f"HTTP {status}", status, status in self.RETRY_STATUS, retry_after)
+
+    @staticmethod
+    def is_dns_error(e):
+        """沿异常链查找 DNS 解析失败（requests 把它包在 ConnectionError 里）"""
+        seen = set()
+        while e is not None and id(e) not in seen:
+            seen.add(id(e))
+            if isinstance(e, socket.gaierror) or type(e).__name__ in ('NameResolutionError', 'ClientConnectorDNSError'):
+                return True
+            if isinstance(getattr(e, 'os_error', None), socket.gaierror):
+                return True
+            reason = getattr(e, 'reason', None)
+            nested = reason if isinstance(reason, BaseException) else None
+            if nested is None and e.args and isinstance(e.args[0], BaseException):
+                nested = e.args[0]
+            e = nested or e.__cause__ or e.__context__
+        return False
+
+    def classify(self, e):
+        """返回 (是否可重试, 原因, 是否整个主机失败)"""
+        if isinstance(e, FetchError):
+            return e.transient, e.reason, False
+        if self.is_dns_error(e):
+            return False, "DNS 解析失败", True
+        if isinstance(e, (requests.exceptions.Timeout, asyncio.TimeoutError)):
+            return True, "超时", False
+        if isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError)):
+            return True, "连接错误", False
+        if aiohttp is not None and isinstance(e, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)):
+            return True, "连接错误", False
+        return False, f"下载错误: {e}", False
+
+    def delay(self, attempt, e):
+        """第 attempt 次失败后的等待秒数：指数退避 × [0.5, 1.5) 抖动，服务器给出 Retry-After 时不少于它"""
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt)) * (0.5 + random.random())
+        retry_after = getattr(e, 'retry_after', None)
+        if retry_after: delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+    def known_failure(self, url):
+        """返回本任务中已确认失败的原因，没有记录时返回 None"""
+        with self._lock:
+            reason = self.failed_urls.get(url) or self.failed_hosts.get(urlparse(url).netloc.lower())
+            if reason: self.skipped += 1
+            return reason
+
+    def begin(self, url):
+        """同一网址同时只允许一个请求：返回 None 表示由调用方发起，否则返回要等待的 Event"""
+        with self._lock:
+            event = self._inflight.get(url)
+            if event is None:
+                self._inflight[url] = threading.Event()
+            return event
+
+    def end(self, url):
+        with self._lock:
+            event = self._inflight.pop(url, None)
+        if event: event.set()
+
+    def remember(self, url, reason, whole_host=False):
+        with self._lock:
+            if whole_host:
+                self.failed_hosts[urlparse(url).netloc.lower()] = reason
+            else:
+                self.failed_urls[url] = reason
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def record_recovered(self):
+        with self._lock:
+            self.recovered += 1
+
+    def summary(self):
+        return (f"🔁 重试: 共重试 {self.retries} 次, 重试后成功 {self.recovered} 个; "
+                f"负缓存 {len(self.failed_urls)} 个网址、{len(self.failed_hosts)} 个主机, 跳过请求 {self.skipped} 次")
+
+# ================= 抓取上限 =================
+
+class BudgetExceeded(FetchError):
+    """抓取上限用尽或单个文件超过大小上限，不重试也不记入负缓存"""
+
+class CrawlLimits:
+    """单个任务的抓取上限：页面数、总流量、单文件大小和用时，0 表示不限
+
+    总流量或用时用尽后不再开始新的页面和资源下载，正在传输的响应中止，
+    已经解析的页面用已下载的资源照常保存。页面数达到上限只是不再加入新页面。
+    """
+    def __init__(self, max_pages=0, max_bytes=0, max_file_size=0, time_limit=0, log=None, clock=time.monotonic):
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.time_limit = time_limit
+        # clock 为 TaskControl.clock 时暂停的时间不计入用时
+        self.clock = clock
+        self.deadline = clock() + time_limit if time_limit else None
+        self.pages = 0
+        self.bytes = 0
+        self.reason = None
+        self.skipped_pages = 0
+        self.skipped_files = 0
+        self.log = log or (lambda msg, tag="info": None)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.max_pages or self.max_bytes or self.max_file_size or self.time_limit)
+
+    @property
+    def cut_short(self):
+        """任务因上限提前结束或有页面未抓取，此时保留抓取日志，下次运行继续"""
+        return self.reason is not None or self.skipped_pages > 0
+
+    @property
+    def exhausted(self):
+        if self.reason is None and self.deadline and self.clock() >= self.deadline:
+            self.stop(f"已到达用时上限 {self.time_limit:g}s")
+        return self.reason is not None
+
+    def stop(self, reason):
+        with self._lock:
+            if self.reason is not None: return
+            self.reason = reason
+        self.log(f"⏹️ {reason}，不再开始新的页面和资源下载", "warning")
+
+    def admit_page(self):
+        """登记一个新页面，超出页面数上限或预算已用尽时返回 False"""
+        exhausted = self.exhausted
+        with self._lock:
+            if not exhausted and (not self.max_pages or self.pages < self.max_pages):
+                self.pages += 1
+                return True
+            self.skipped_pages += 1
+            return False
+
+    def drop_pages(self, count):
+        with self._lock:
+            self.skipped_pages += count
+
+    def skip_file(self):
+        with self._lock:
+            self.skipped_files += 1
+
+    def add_bytes(self, nbytes):
+        with self._lock:
+            self.bytes += nbytes
+            over = self.max_bytes and self.bytes >= self.max_bytes
+        if over: self.stop(f"已达到总流量上限 {self.max_bytes / 1024 / 1024:.0f} MB")
+
+    def check(self, received=None):
+        """传输过程中调用：预算用尽或当前文件超过大小上限时抛出 BudgetExceeded"""
+        if self.max_file_size and received is not None and received > self.max_file_size:
+            raise BudgetExceeded(f"超过单文件上限 {self.max_file_size / 1024 / 1024:.1f} MB")
+        if self.exhausted:
+            raise BudgetExceeded(self.reason)
+
+    def check_length(self, headers):
+        """收到响应头后按 Content-Length 检查单文件大小"""
+        length = headers.get('Content-Length', '')
+        if length.isdigit(): self.check(int(length))
+        elif self.exhausted: raise BudgetExceeded(self.reason)
+
+    def summary(self):
+        def limit(value, total, unit=1, suffix=''):
+            return f"{value / unit:.1f}{suffix}/{total / unit:.0f}{suffix}" if total else f"{value / unit:.1f}{suffix}"
+        pages = f"{self.pages}/{self.max_pages}" if self.max_pages else f"{self.pages}"
+        text = (f"📏 抓取上限: 页面 {pages}, 流量 {limit(self.bytes, self.max_bytes, 1024 * 1024, ' MB')}, "
+                f"跳过 {self.skipped_pages} 个页面、{self.skipped_files} 个资源")
+        return text + (f"; 提前结束: {self.reason}" if self.reason else "")
+
+# ================= 暂停与停止 =================
+
+class TaskCancelled(FetchError):
+    """任务被停止，不重试也不记入负缓存"""
+
+class TaskControl:
+    """暂停/停止令牌：由界面或命令行设置，下载引擎在调度循环和传输循环中检查
+
+    同一批任务共享一个令牌。暂停后不再开始新的页面和请求，正在传输的响应停在下一个数据块；
+    停止后排队中的工作被取消，传输中的响应中止并关闭连接，临时文件删除，
+    分段下载已写入的部分和抓取日志保留，下次运行从断点继续。
+    """
+    CHECK_INTERVAL = 0.2   # 调度循环和异步等待检查令牌的间隔（秒）
+
+    def __init__(self):
+        self._running = threading.Event()
+        self._running.set()
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._paused_at = None
+        self.paused_total = 0
+        self._cancel_callbacks = []
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def pause(self):
+        with self._lock:
+            if self._paused_at is None and not self.cancelled:
+                self._paused_at = time.monotonic()
+                self._running.clear()
+
+    def resume(self):
+        with self._lock:
+            if self._paused_at is not None:
+                self.paused_total += time.monotonic() - self._paused_at
+                self._paused_at = None
+            self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        # 唤醒暂停中等待的线程，让它们看到停止标记
+        self.resume()
+        with self._lock:
+            callbacks = list(self._cancel_callbacks)
+        for callback in callbacks: callback()
+
+    def add_cancel_callback(self, callback):
+        """停止时调用 callback()，用于唤醒在其他条件变量上等待的线程"""
+        with self._lock:
+            self._cancel_callbacks.append(callback)
+
+    def remove_cancel_callback(self, callback):
+        with self._lock:
+            if callback in self._cancel_callbacks: self._cancel_callbacks.remove(callback)
+
+    def clock(self):
+        """不计暂停时间的单调时钟"""
+        with self._lock:
+            paused = self.paused_total
+            if self._paused_at is not None: paused += time.monotonic() - self._paused_at
+        return time.monotonic() - paused
+
+    def wait(self):
+        """暂停时阻塞到继续或停止，返回任务是否仍在运行"""
+        self._running.wait()
+        return not self.cancelled
+
+    async def wait_async(self):
+        while not self._running.is_set():
+            await asyncio.sleep(self.CHECK_INTERVAL)
+        return not self.cancelled
+
+    def sleep(self, seconds):
+        """可被停止打断的等待（重试退避），返回任务是否仍在运行"""
+        return not self._cancelled.wait(seconds)
+
+    def check(self):
+        """传输循环中调用：暂停时阻塞，已停止时抛出 TaskCancelled"""
+        if not self.wait(): raise TaskCancelled("任务已停止")
+
+    async def check_async(self):
+        if not await self.wait_async(): raise TaskCancelled("任务已停止")
+
+# ================= 跨任务 HTTP 缓存 =================
+
+def normalize_url(url):
+    """缓存键使用的 URL 规范化：协议/主机小写、去掉默认端口和片段"""
+    parts = urlparse(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if ':' in host: host = f"[{host}]"   # IPv6 字面量保留方括号
+    port = parts.port
+    if port and not ((scheme == 'http' and port == 80) or (scheme == 'https' and port == 443)):
+        host = f"{host}:{port}"
+    return urlunparse((scheme, host, parts.path or '/', parts.params, parts.query, ''))
+
+class HttpCache:
+    """保存在磁盘上的跨任务 HTTP 缓存
+
+    以规范化 URL 为键记录 ETag / Last-Modified，下次请求时发送条件请求头；
+    服务器返回 304 时把缓存的响应体硬链接（失败则复制）到新的任务目录。
+    缓存总大小超过上限时按最近使用时间淘汰。
+
+    注意：任务目录中的文件可能与缓存对象共用同一个 inode，
+    需要修改已下载文件时应写入新文件再替换，不能原地改写。
+    """
+    def __init__(self, cache_dir, max_bytes=1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite3'), check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY, url TEXT, etag TEXT, last_modified TEXT,
+            content_type TEXT, size INTEGER, last_used REAL)""")
+        self.db.commit()
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+        self.revalidated = 0
+        self.stored = 0
+        self.evicted = 0
+
+    def key_for(self, url):
+        return hashlib.sha1(normalize_url(url).encode('utf-8')).hexdigest()
+
+    def object_path(self, key):
+        return os.path.join(self.objects_dir, key[:2], key)
+
+    def lookup(self, url):
+        """返回 (key, etag, last_modified, content_type, size)，没有可用缓存时返回 None"""
+        key = self.key_for(url)
+        with self._lock:
+            row = self.db.execute(
+                "SELECT etag, last_modified, content_type, size FROM entries WHERE key=?", (key,)).fetchone()
+        if row is None or not os.path.exists(self.object_path(key)):
+            return None
+        return (key,) + tuple(row)
+
+    def conditional_headers(self, url):
+        entry = self.lookup(url)
+        headers = {}
+        if entry:
+            _, etag, last_modified, _, _ = entry
+            if etag: headers['If-None-Match'] = etag
+            if last_modified: headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def touch(self, key):
+        with self._lock:
+            self.db.execute("UPDATE entries SET last_used=? WHERE key=?", (time.time(), key))
+            self.db.commit()
+
+    def record_hit(self, url):
+        """响应体由其他途径（如对象库）提供时，仍记录一次 304 复用"""
+        self.touch(self.key_for(url))
+        with self._lock:
+            self.revalidated += 1
+
+    def read(self, url):
+        """304 时读取缓存的响应体，返回 (bytes, content_type)"""
+        entry = self.lookup(url)
+        if entry is None: return None, None
+        key, _, _, content_type, _ = entry
+        with open(self.object_path(key), 'rb') as f:
+            data = f.read()
+        self.touch(key)
+        with self._lock:
+            self.revalidated += 1
+        return data, content_type
+
+    def materialize(self, url, dest_path):
+        """304 时把缓存对象放到任务目录，成功返回 True"""
+        entry = self.lookup(url)
+        if entry is None: return False
+        key = entry[0]
+        link_or_copy(self.object_path(key), dest_path)
+        self.touch(key)
+        with self._lock:
+            self.revalidated += 1
+        return True
+
+    def store(self, url, headers, src_path=None, data=None):
+        """缓存一个 200 响应，只有带 ETag 或 Last-Modified 的响应才值得缓存"""
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if not etag and not last_modified: return
+        key = self.key_for(url)
+        obj_path = self.object_path(key)
+        os.makedirs(os.path.dirname(obj_path), exist_ok=True)
+        tmp_path = f"{obj_path}.{threading.get_ident()}.tmp"
+        try:
+            if src_path is not None:
+                link_or_copy(src_path, tmp_path)
+            else:
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+            os.replace(tmp_path, obj_path)
+        except OSError:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+            return
+        size = os.path.getsize(obj_path)
+        with self._lock:
+            row = self.db.execute("SELECT size FROM entries WHERE key=?", (key,)).fetchone()
+            self.total_bytes += size - (row[0] if row else 0)
+            self.db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (key, normalize_url(url), etag, last_modified,
+                             headers.get('Content-Type'), size, time.time()))
+            self.db.commit()
+            self.stored += 1
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """按最近使用时间淘汰，直到总大小降到上限的 90%"""
+        target = int(self.max_bytes * 0.9)
+        with self._lock:
+            rows = self.db.execute("SELECT key, size FROM entries ORDER BY last_used ASC").fetchall()
+            for key, size in rows:
+                if self.total_bytes <= target: break
+                try:
+                    os.remove(self.object_path(key))
+                except OSError:
+                    pass
+                self.db.execute("DELETE FROM entries WHERE key=?", (key,))
+                self.total_bytes -= size
+                self.evicted += 1
+            self.db.commit()
+
+    def summary(self):
+        return (f"🗄️ HTTP 缓存: 304 复用 {self.revalidated} 个, 新写入 {self.stored} 个, "
+                f"淘汰 {self.evicted} 个, 当前 {self.total_bytes / 1024 / 1024:.1f} MB")
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+# ================= 网址规范化 =================
+
+# 只用于统计来源、不影响页面内容的查询参数；以 _ 结尾的按前缀匹配
+TRACKING_PARAMS = ('utm_', 'spm', 'fbclid', 'gclid', 'yclid', 'msclkid', 'mc_cid', 'mc_eid', '_hsenc', '_hsmi')
+
+class UrlCanonicalizer:
+    """页面和资源去重使用的网址规范化
+
+    在 normalize_url（协议/主机小写、去掉默认端口）的基础上按规则处理：
+      strip_fragment        去掉 #片段（片段不会发给服务器）
+      strip_params          去掉的查询参数名，以 _ 结尾的按前缀匹配
+      sort_query            按参数名排序，使参数顺序不同的网址视为同一个
+      strip_trailing_slash  把 /page/ 与 /page 视为同一个（默认关闭，部分站点两者内容不同）
+    另外记录页面重定向的别名：/page 跳转到 /page/ 后，之后再遇到 /page 直接按 /page/ 去重。
+
+    规范化结果只作为去重键。claim() 按类别（'page' / 'asset'）登记，返回实际请求的网址：
+    第一次出现时的原始写法，只去掉片段和统计参数，其余查询串按原样保留。
+    原始写法不同但规范化后已登记过的网址计为一次避免的重复抓取。
+    """
+    def __init__(self, strip_fragment=True, strip_params=TRACKING_PARAMS, sort_query=True,
+                 strip_trailing_slash=False):
+        self.strip_fragment = strip_fragment
+        self.strip_params = tuple(name.lower() for name in strip_params or ())
+        self.sort_query = sort_query
+        self.strip_trailing_slash = strip_trailing_slash
+        self.aliases = {}
+        self.claimed = {'page': {}, 'asset': {}}   # 规范化网址 -> 实际请求的网址
+        self.seen = {'page': set(), 'asset': set()}
+        self.avoided = {'page': 0, 'asset': 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_params(cls, rules):
+        return cls(**(rules or {}))
+
+    def drop_param(self, name):
+        name = name.lower()
+        return any(name.startswith(rule) if rule.endswith('_') else name == rule
+                   for rule in self.strip_params)
+
+    def strip_query(self, query):
+        """去掉统计参数，保留其余参数的原始写法和顺序"""
+        if not query or not self.strip_params: return query
+        return '&'.join(part for part in query.split('&')
+                        if not (part and self.drop_param(unquote_plus(part.split('=', 1)[0]))))
+
+    def fetch_url(self, url):
+        """实际请求的网址：原始写法去掉片段和统计参数"""
+        parts = urlsplit(url)
+        if parts.scheme.lower() not in ('http', 'https'):
+            return url
+        return urlunsplit((parts.scheme, parts.netloc, parts.path, self.strip_query(parts.query),
+                           '' if self.strip_fragment else parts.fragment))
+
+    def canonical(self, url):
+        parts = urlparse(url)
+        if parts.scheme.lower() not in ('http', 'https'):
+            return url
+        fragment = parts.fragment
+        url = normalize_url(url)
+        parts = urlparse(url)
+        query = parts.query
+        if query and (self.strip_params or self.sort_query):
+            params = parse_qsl(query, keep_blank_values=True)
+            params = [(k, v) for k, v in params if not self.drop_param(k)]
+            if self.sort_query: params.sort(key=lambda kv: kv[0])
+            query = urlencode(params)
+        path = parts.path
+        if self.strip_trailing_slash and len(path) > 1 and path.endswith('/'):
+            path = path.rstrip('/') or '/'
+        url = urlunparse((parts.scheme, parts.netloc, path, parts.params, query,
+                          '' if self.strip_fragment else fragment))
+        return self.aliases.get(url, url)
+
+    def claim(self, url, kind='page'):
+        """登记网址，返回 (实际请求的网址, 是否第一次出现)；同一规范化网址总是返回第一次登记的写法"""
+        canonical = self.canonical(url)
+        with self._lock:
+            if canonical not in self.claimed[kind]:
+                fetch_url = self.claimed[kind][canonical] = self.fetch_url(url)
+                self.seen[kind].add(url)
+                return fetch_url, True
+            # 只有以新的写法再次出现时才算规范化避免的抓取，原样重复的链接本来就不会重复下载
+            if url not in self.seen[kind]:
+                self.seen[kind].add(url)
+                self.avoided[kind] += 1
+            return self.claimed[kind][canonical], False
+
+    def resolve(self, url, kind='asset'):
+        """不登记，返回 claim() 对这个网址会给出的请求网址"""
+        with self._lock:
+            return self.claimed[kind].get(self.canonical(url)) or self.fetch_url(url)
+
+    def redirected(self, url, final_url):
+        """记录页面重定向别名，返回 False 表示跳转目标已由其他页面抓取"""
+        source, target = self.canonical(url), self.canonical(final_url)
+        if source == target: return True
+        with self._lock:
+            self.aliases[source] = target
+            if target in self.claimed['page']:
+                self.avoided['page'] += 1
+                return False
+            self.claimed['page'][target] = self.fetch_url(final_url)
+            return True
+
+    def summary(self):
+        total = self.avoided['page'] + self.avoided['asset']
+        return (f"🧭 网址规范化: 避免重复抓取 {total} 次 (页面 {self.avoided['page']}, "
+                f"资源 {self.avoided['asset']}), 重定向别名 {len(self.aliases)} 个")
+
+# ================= 内容寻址对象库 =================
+
+class AssetStore:
+    """按内容 SHA-256 存储资源的对象库，跨页面、跨任务去重
+
+    任务目录中的资源文件是对象的硬链接（不支持时退回复制），
+    另外维护一份 URL -> 内容哈希的索引。
+    """
+    INDEX_BATCH = 200
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.objects_dir = os.path.join(store_dir, 'objects')
+        self.tmp_dir = os.path.join(store_dir, 'tmp')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(store_dir, 'index.sqlite3'), check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS urls (
+            url TEXT PRIMARY KEY, digest TEXT, size INTEGER, updated REAL)""")
+        self.db.commit()
+        self._pending_rows = []
+
+        self.stored = 0
+        self.deduped = 0
+        self.saved_bytes = 0
+
+    @staticmethod
+    def hash_file(path):
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def temp_path(self):
+        return os.path.join(self.tmp_dir, f"{uuid.uuid4().hex}.tmp")
+
+    def partial_dir(self, url):
+        """分段下载的 .part 文件目录，按 URL 固定，中断后下次可以续传"""
+        key = hashlib.sha1(normalize_url(url).encode('utf-8')).hexdigest()
+        return os.path.join(self.store_dir, 'partial', key)
+
+    def claim_partial(self, url):
+        """取得分段下载目录的独占使用权，返回 (目录, 是否为可续传的共享目录)
+
+        同一保存路径下的多个任务（图形界面队列、命令行 -j 或另一个进程）可能同时下载同一个文件。
+        共享目录由 O_EXCL 创建的锁文件独占，锁已被占用时改用本次专用的临时目录；
+        锁文件记录持有者的进程号，持有进程已退出的锁视为残留并接管。
+        """
+        part_dir = self.partial_dir(url)
+        lock_path = part_dir + '.lock'
+        os.makedirs(os.path.dirname(part_dir), exist_ok=True)
+        for _ in range(2):
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if self.lock_held(lock_path): break
+                remove_quietly(lock_path)
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write(str(os.getpid()))
+            return part_dir, True
+        return f"{part_dir}.{uuid.uuid4().hex[:8]}", False
+
+    @staticmethod
+    def lock_held(lock_path):
+        try:
+            with open(lock_path) as f:
+                pid = int(f.read().strip())
+        except OSError:
+            return False
+        except ValueError:
+            # 另一方刚创建锁文件、还没写入进程号
+            return True
+        return pid == os.getpid() or process_alive(pid)
+
+    def release_partial(self, part_dir, shared):
+        """释放 claim_partial 取得的目录：共享目录只解锁（保留续传数据），临时目录直接删除"""
+        if shared:
+            remove_quietly(part_dir + '.lock')
+        else:
+            shutil.rmtree(part_dir, ignore_errors=True)
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def lookup(self, url):
+        """返回 URL 上次对应的内容哈希（对象仍存在时）"""
+        with self._lock:
+            self._flush()
+            row = self.db.execute("SELECT digest FROM urls WHERE url=?", (normalize_url(url),)).fetchone()
+        if row and os.path.exists(self.object_path(row[0])):
+            return row[0]
+        return None
+
+    def commit(self, tmp_path, digest, url=None):
+        """把临时文件移入对象库（内容已存在则直接丢弃），返回对象路径
+
+        url 为 None 时不登记 URL 索引：转换后的图片与服务器返回的内容不同，
+        304 时按 URL 复用它会把上次的转换结果当成原图。
+        """
+        obj_path = self.object_path(digest)
+        size = os.path.getsize(tmp_path)
+        if os.path.exists(obj_path):
+            os.remove(tmp_path)
+            deduped = True
+        else:
+            os.makedirs(os.path.dirname(obj_path), exist_ok=True)
+            os.replace(tmp_path, obj_path)
+            deduped = False
+        with self._lock:
+            if deduped:
+                self.deduped += 1
+                self.saved_bytes += size
+            else:
+                self.stored += 1
+            if url is not None:
+                self._pending_rows.append((normalize_url(url), digest, size, time.time()))
+            if len(self._pending_rows) >= self.INDEX_BATCH:
+                self._flush()
+        return obj_path
+
+    def _flush(self):
+        if self._pending_rows:
+            self.db.executemany("INSERT OR REPLACE INTO urls VALUES (?, ?, ?, ?)", self._pending_rows)
+            self.db.commit()
+            self._pending_rows = []
+
+    def summary(self):
+        return (f"🧬 对象库: 新增 {self.stored} 个对象, 内容去重 {self.deduped} 次, "
+                f"节省 {self.saved_bytes / 1024 / 1024:.1f} MB")
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self.db.close()
+
+CSS_URL_RE = re.compile(r'url\(\s*(["\']?)([^)"\']+)\1\s*\)')
+
+def charset_from_content_type(content_type):
+    match = re.search(r'charset=["\']?([\w.:-]+)', content_type or '', re.I)
+    return match.group(1) if match else None
+
+# ================= 编码识别 =================
+
+BOMS = [
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+]
+META_CHARSET_RE = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([\w.:-]+)', re.I)
+META_SNIFF_BYTES = 4096
+
+# 常见的错误标注：网页声明 gb2312/gbk，实际常含有超出字符集的字，统一按超集 gb18030 解码
+ENCODING_ALIASES = {'gb2312': 'gb18030', 'gbk': 'gb18030', 'x-gbk': 'gb18030',
+                    'iso-8859-1': 'windows-1252', 'ascii': 'windows-1252', 'us-ascii': 'windows-1252'}
+
+def normalize_encoding(name):
+    """校验编码名并映射到更宽松的超集，无法识别时返回 None"""
+    if not name: return None
+    name = name.strip().strip('"\'').lower()
+    name = ENCODING_ALIASES.get(name, name)
+    try:
+        codecs.lookup(name)
+    except LookupError:
+        return None
+    return name
+
+def sniff_encoding(body, content_type=None):
+    """不做全文统计的情况下识别页面编码
+
+    依次检查 BOM、Content-Type 响应头、前 4KB 内的 <meta charset>，
+    再尝试严格 UTF-8 解码；都失败时才做统计检测。
+    返回 (编码, 来源)，来源为 bom/header/meta/utf-8/detected 之一。
+    """
+    for bom, name in BOMS:
+        if body.startswith(bom):
+            return name, 'bom'
+
+    encoding = normalize_encoding(charset_from_content_type(content_type))
+    if encoding:
+        return encoding, 'header'
+
+    match = META_CHARSET_RE.search(body[:META_SNIFF_BYTES])
+    encoding = normalize_encoding(match.group(1).decode('ascii', 'ignore')) if match else None
+    if encoding:
+        return encoding, 'meta'
+
+    try:
+        body.decode('utf-8')
+        return 'utf-8', 'utf-8'
+    except UnicodeDecodeError:
+        pass
+
+    return detect_encoding(body), 'detected'
+
+def detect_encoding(body):
+    """最后手段：全文统计检测编码"""
+    try:
+        from charset_normalizer import from_bytes
+        best = from_bytes(body).best()
+        if best: return best.encoding
+    except ImportError:
+        try:
+            import chardet
+            guess = chardet.detect(body).get('encoding')
+            if guess: return normalize_encoding(guess) or 'utf-8'
+        except ImportError:
+            pass
+    return 'utf-8'
+
+def link_or_copy(src, dst):
+    """优先创建硬链接，跨分区或文件系统不支持时尝试 reflink，最后退回复制"""
+    try:
+        os.link(src, dst)
+        return
+    except FileExistsError:
+        # 旧文件可能是其他对象的硬链接，只能删除后重建，不能原地覆盖
+        os.remove(dst)
+        return link_or_copy(src, dst)
+    except OSError:
+        pass
+    if reflink(src, dst): return
+    shutil.copyfile(src, dst)
+
+def reflink(src, dst):
+    """在支持写时复制的文件系统（btrfs/xfs 等）上创建 reflink，失败返回 False"""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    FICLONE = 0x40049409
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        remove_quietly(dst)
+        return False
+
+# ================= 样式表处理 =================
+
+CSS_IMPORT_RE = re.compile(r'@import\s+(?:url\(\s*)?(["\']?)([^"\')\s;]+)\1')
+FONT_EXTS = ('.woff', '.woff2', '.ttf', '.otf', '.eot')
+
+def css_references(text):
+    """返回样式表中引用的 [(原始地址, 是否 @import)]，按出现顺序去重，跳过 data: 和 #片段引用"""
+    imports = {match.group(2).strip() for match in CSS_IMPORT_RE.finditer(text)}
+    refs = {}
+    for raw in [m.group(2) for m in CSS_IMPORT_RE.finditer(text)] + [m.group(2) for m in CSS_URL_RE.finditer(text)]:
+        raw = raw.strip()
+        if raw and not raw.startswith(('data:', '#')) and raw not in refs:
+            refs[raw] = raw in imports
+    return list(refs.items())
+
+def css_folder(url):
+    """样式表里引用的资源按扩展名放进 fonts 或 images 目录"""
+    return 'fonts' if urlparse(url).path.lower().endswith(FONT_EXTS) else 'images'
+
+def rewrite_css(text, local):
+    """把 @import 和 url() 中的地址替换为 local(raw) 的结果，返回 None 的保持原样"""
+    def replace_url(match):
+        rel_path = local(match.group(2).strip())
+        return f'url("{rel_path}")' if rel_path else match.group(0)
+
+    def replace_import(match):
+        # @import url(...) 交给下面的 url() 替换
+        if 'url(' in match.group(0): return match.group(0)
+        rel_path = local(match.group(2).strip())
+        return f'@import "{rel_path}"' if rel_path else match.group(0)
+
+    return CSS_URL_RE.sub(replace_url, CSS_IMPORT_RE.sub(replace_import, text))
+
+class StylesheetGraph:
+    """记录样式表之间的 @import 依赖，用于发现循环引用
+
+    样式表要等它 @import 的样式表处理完才能改写；a 引用 b、b 又引用 a 时
+    互相等待会卡死，所以登记依赖前先检查 child 能否沿已有的边回到 parent。
+    """
+    def __init__(self):
+        self.edges = {}
+        self.processed = {}
+        self.paths = {}
+        self.imports = 0
+        self.assets = 0
+        self.cycles = 0
+        self._lock = threading.Lock()
+
+    def depend(self, parent, child):
+        """登记 parent -> child，会形成循环时返回 False"""
+        with self._lock:
+            stack, seen = [child], set()
+            while stack:
+                node = stack.pop()
+                if node == parent:
+                    self.cycles += 1
+                    return False
+                if node in seen: continue
+                seen.add(node)
+                stack.extend(self.edges.get(node, ()))
+            self.edges.setdefault(parent, set()).add(child)
+            self.imports += 1
+            return True
+
+    def claim(self, url, rel_path, result):
+        """同一个文件只处理一次（内容相同的样式表会共用同一个文件），返回先登记的结果"""
+        with self._lock:
+            self.paths[url] = rel_path
+            return self.processed.setdefault(rel_path, result)
+
+    def count_assets(self, n):
+        with self._lock:
+            self.assets += n
+
+    def summary(self):
+        return (f"🎨 样式表: 处理 {len(self.processed)} 个, 跟随 @import {self.imports} 个, "
+                f"引用资源 {self.assets} 个, 循环引用 {self.cycles} 处")
+
+# ================= 文件名分配 =================
+
+class FilenameAllocator:
+    """任务级文件名分配器
+
+    在内存中维护 URL -> 任务内相对路径的映射，保证同一 URL 得到稳定的文件名、
+    不同 URL 不会争用同一个文件名（冲突时追加 URL 哈希后缀）。
+    目录只在第一次分配时创建一次，分配过程中不做任何文件系统探测。
+    """
+    MAX_NAME_LEN = 100
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self._lock = threading.Lock()
+        self._by_url = {}     # (url, sub_folder) -> 相对路径
+        self._taken = set()   # 已占用的相对路径（小写，兼容大小写不敏感的文件系统）
+        self._dirs = set()
+
+    @staticmethod
+    def url_hash(url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]
+
+    def split_name(self, url):
+        """从 URL 路径中取出清理后的 (主名, 扩展名)"""
+        filename = unquote(os.path.basename(urlparse(url).path))
+        filename = re.sub(r'[\\/*?:"<>|\x00-\x1f]', "", filename).strip(' .')
+        stem, ext = os.path.splitext(filename)
+        if len(ext) > 10 or not re.fullmatch(r'\.[\w-]*', ext or '.'): stem, ext = filename, ''
+        if len(stem) > self.MAX_NAME_LEN: stem = stem[-50:]
+        return stem, ext.lower()
+
+    def allocate(self, url, sub_folder, content_type=None, ext=None, default_stem=None):
+        """为 URL 分配任务内相对路径
+
+        ext 用于强制指定扩展名（例如图片转换后的格式）；URL 没有扩展名时
+        根据 Content-Type 推断，仍无法确定时使用 .dat。
+        """
+        key = (url, sub_folder)
+        with self._lock:
+            relative_path = self._by_url.get(key)
+            if relative_path: return relative_path
+
+            stem, url_ext = self.split_name(url)
+            if ext is None:
+                ext = url_ext or guess_extension(content_type) or '.dat'
+            suffix = self.url_hash(url)
+            if not stem: stem = default_stem or f"file-{suffix}"
+
+            candidates = [f"{stem}{ext}", f"{stem}-{suffix}{ext}"]
+            candidates += (f"{stem}-{suffix}-{n}{ext}" for n in range(2, 1000))
+            for name in candidates:
+                relative_path = f"{sub_folder}/{name}" if sub_folder else name
+                if relative_path.lower() not in self._taken: break
+            self._taken.add(relative_path.lower())
+            self._by_url[key] = relative_path
+
+            if sub_folder not in self._dirs:
+                os.makedirs(os.path.join(self.root_dir, sub_folder), exist_ok=True)
+                self._dirs.add(sub_folder)
+        return relative_path
+
+    def allocate_page(self, url):
+        """页面统一保存到任务根目录，并保证以 .html 结尾"""
+        stem, ext = self.split_name(url)
+        return self.allocate(url, '', ext=ext if ext in ('.html', '.htm') else f"{ext}.html",
+                             default_stem='index')
+
+    def restore(self, url, sub_folder, relative_path):
+        """恢复续传任务中已经分配过的文件名"""
+        with self._lock:
+            self._by_url[(url, sub_folder)] = relative_path
+            self._taken.add(relative_path.lower())
+            self._dirs.add(sub_folder)
+
+    def is_allocated(self, relative_path):
+        with self._lock:
+            return relative_path.lower() in self._taken
+
+    def local_path(self, relative_path):
+        return os.path.join(self.root_dir, *relative_path.split('/'))
+
+def guess_extension(content_type):
+    """根据 Content-Type 推断扩展名"""
+    if not content_type: return None
+    mime = content_type.split(';')[0].strip().lower()
+    return {'image/jpeg': '.jpg', 'text/javascript': '.js', 'application/javascript': '.js'}.get(
+        mime, mimetypes.guess_extension(mime))
+
+def process_alive(pid):
+    """判断进程是否仍在运行，用于识别崩溃后残留的锁文件"""
+    if os.name == 'nt':
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle: return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+# ================= 抓取日志 =================
+
+class CrawlJournal:
+    """保存在任务目录中的 SQLite 抓取日志，程序或网络中断后可以继续同一个任务
+
+    记录待抓取的页面（frontier）、已保存的页面和资源下载结果，
+    资源结果即 URL -> 任务内相对路径的改写映射。写入先进入内存缓冲，
+    攒够一批、超过时间间隔或有页面保存完成时在一个事务中提交；任务正常完成后删除日志文件。
+    """
+    FILENAME = '.crawl_journal.sqlite3'
+    BATCH_SIZE = 200
+    BATCH_SECONDS = 1.0
+
+    def __init__(self, task_dir):
+        self.path = os.path.join(task_dir, self.FILENAME)
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, depth INTEGER, seq INTEGER, path TEXT);
+            CREATE TABLE IF NOT EXISTS assets (url TEXT, folder TEXT, path TEXT, digest TEXT,
+                                               PRIMARY KEY (url, folder));""")
+        self.db.commit()
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._seq = self.db.execute("SELECT COALESCE(MAX(seq), 0) FROM pages").fetchone()[0]
+
+    @classmethod
+    def find_unfinished(cls, root_dir, url, exclude=()):
+        """在保存路径下查找同一起始网址、留有抓取日志（即未完成）的最新任务目录"""
+        prefix = urlparse(url).netloc.replace("www.", "") + "_"
+        try:
+            names = sorted((name for name in os.listdir(root_dir) if name.startswith(prefix)), reverse=True)
+        except OSError:
+            return None
+        for name in names:
+            path = os.path.join(root_dir, name, cls.FILENAME)
+            if os.path.join(root_dir, name) in exclude or not os.path.exists(path): continue
+            try:
+                db = sqlite3.connect(path)
+                try:
+                    row = db.execute("SELECT value FROM meta WHERE key='start_url'").fetchone()
+                finally:
+                    db.close()
+            except sqlite3.Error:
+                continue
+            if row and row[0] == url:
+                return os.path.join(root_dir, name)
+        return None
+
+    def load(self):
+        """返回 (待抓取页面 [(url, depth)], 已保存页面 {url: 路径}, 资源结果 [(url, folder, 路径, digest)])"""
+        with self._lock:
+            self._flush()
+            pages = self.db.execute("SELECT url, depth, path FROM pages ORDER BY seq").fetchall()
+            assets = self.db.execute("SELECT url, folder, path, digest FROM assets").fetchall()
+        queued = [(url, depth) for url, depth, path in pages if path is None]
+        saved = {url: path for url, _, path in pages if path is not None}
+        return queued, saved, assets
+
+    def begin(self, start_url):
+        with self._lock:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('start_url', ?)", (start_url,))
+            self.db.commit()
+
+    def page_queued(self, url, depth):
+        with self._lock:
+            self._seq += 1
+            self._add("INSERT OR IGNORE INTO pages VALUES (?, ?, ?, NULL)", (url, depth, self._seq))
+
+    def page_saved(self, url, path):
+        # 页面是续传的基本单位：保存页面时连同缓冲中的资源记录一起提交
+        with self._lock:
+            self._pending.append(("UPDATE pages SET path=? WHERE url=?", (path, url)))
+            self._flush()
+
+    def asset_saved(self, url, folder, path, digest):
+        with self._lock:
+            self._add("INSERT OR REPLACE INTO assets VALUES (?, ?, ?, ?)", (url, folder, path, digest))
+
+    def _add(self, sql, args):
+        self._pending.append((sql, args))
+        if len(self._pending) >= self.BATCH_SIZE or time.monotonic() - self._last_flush >= self.BATCH_SECONDS:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            with self.db:
+                for sql, args in self._pending:
+                    self.db.execute(sql, args)
+            self._pending = []
+        self._last_flush = time.monotonic()
+
+    def close(self, completed=False):
+        """提交缓冲中的记录；任务已完成时删除日志文件"""
+        with self._lock:
+            self._flush()
+            self.db.close()
+        if completed:
+            for suffix in ('', '-wal', '-shm'):
+                remove_quietly(self.path + suffix)
+
+# ================= HTML 解析后端 =================
+
+class SoupParser:
+    """BeautifulSoup 解析后端（兼容模式，容错性最好）"""
+    name = 'bs4'
+
+    def parse(self, markup, encoding=None):
+        return BeautifulSoup(markup, 'lxml', from_encoding=encoding)
+
+    def candidates(self, doc):
+        return doc.find_all(True)
+
+    def tag_name(self, el):
+        return el.name
+
+    def get(self, el, attr):
+        value = el.get(attr)
+        return ' '.join(value) if isinstance(value, list) else value
+
+    def parent(self, el):
+        return el.parent
+
+    def set(self, el, attr, value):
+        el[attr] = value
+
+    def text(self, el):
+        return el.string
+
+    def set_text(self, el, value):
+        el.string = value
+
+    def serialize(self, doc):
+        return str(doc)
+
+class LxmlDocument:
+    """lxml 解析结果：根元素加上原文中的 DOCTYPE 声明"""
+    __slots__ = ('root', 'doctype')
+
+    def __init__(self, root, doctype):
+        self.root = root
+        self.doctype = doctype
+
+class LxmlParser:
+    """直接基于 lxml.html 的解析后端
+
+    直接解析原始字节，用一次 XPath 取出所有可能含有引用的元素，
+    不构建 BeautifulSoup 对象树。
+    """
+    name = 'lxml'
+    # 单个谓词的 XPath 只遍历一次文档；改用 "|" 并集会多次遍历并做 O(n^2) 的结果合并
+    CANDIDATES = etree.XPath(
+        '//*[self::img or self::video or self::source or (self::script and @src) or (self::link and @href)'
+        ' or (self::object and @data) or self::style or @style or (self::a and @href)]')
+    DOCTYPE_RE = re.compile(r'<!doctype[^>]*>', re.I)
+
+    def parse(self, markup, encoding=None):
+        if isinstance(markup, bytes) and encoding:
+            root = lxml.html.document_fromstring(markup, parser=lxml.html.HTMLParser(encoding=encoding))
+        else:
+            root = lxml.html.document_fromstring(markup)
+        # libxml2 会给没有 DOCTYPE 的文档补一个默认声明，这里只保留原文中真实存在的
+        head = markup[:2048].decode('latin-1') if isinstance(markup, bytes) else markup[:2048]
+        match = self.DOCTYPE_RE.search(head)
+        return LxmlDocument(root, match.group(0) if match else None)
+
+    def candidates(self, doc):
+        return self.CANDIDATES(doc.root)
+
+    def tag_name(self, el):
+        return el.tag if isinstance(el.tag, str) else ''
+
+    def get(self, el, attr):
+        return el.get(attr)
+
+    def parent(self, el):
+        return el.getparent()
+
+    def set(self, el, attr, value):
+        el.set(attr, value)
+
+    def text(self, el):
+        return el.text
+
+    def set_text(self, el, value):
+        el.text = value
+
+    def serialize(self, doc):
+        # 页面统一以 UTF-8 保存，同步修正页面内声明的编码
+        for meta in doc.root.iter('meta'):
+            if meta.get('charset'):
+                meta.set('charset', 'utf-8')
+            elif (meta.get('http-equiv') or '').lower() == 'content-type':
+                meta.set('content', 'text/html; charset=utf-8')
+        return lxml.html.tostring(doc.root, encoding='unicode', method='html', doctype=doc.doctype)
+
+PARSER_BACKENDS = {'lxml': LxmlParser, 'bs4': SoupParser}
+
+# ================= 响应式图片 =================
+
+def parse_srcset(value):
+    """解析 srcset，返回 [(地址, 宽度 w 或 None, 像素密度 x)]
+
+    地址中可以含有逗号（如 CDN 的 w_300,h_200 参数），只有空白之后的逗号才分隔候选项。
+    """
+    candidates = []
+    pos, n = 0, len(value or '')
+    while pos < n:
+        while pos < n and (value[pos].isspace() or value[pos] == ','): pos += 1
+        start = pos
+        while pos < n and not value[pos].isspace(): pos += 1
+        url = value[start:pos]
+        descriptor = ''
+        if url.endswith(','):
+            url = url.rstrip(',')
+        else:
+            start = pos
+            while pos < n and value[pos] != ',': pos += 1
+            descriptor = value[start:pos].strip()
+        if not url: continue
+        width, density = None, 1.0
+        for token in descriptor.split():
+            try:
+                if token.endswith('w'): width = int(token[:-1])
+                elif token.endswith('x'): density = float(token[:-1])
+            except ValueError:
+                pass
+        candidates.append((url, width, density))
+    return candidates
+
+def pick_variant(variants):
+    """variants: [(属性, 地址, 宽度, 像素密度)]；有宽度描述时取最宽的，否则取像素密度最大的，相同时取靠前的"""
+    widths = [v for v in variants if v[2]]
+    if widths: return max(widths, key=lambda v: v[2])
+    return max(variants, key=lambda v: v[3])
+
+# ================= 图片转换与优化 =================
+
+# 界面上的格式名与 Pillow 的格式名不完全一致
+PIL_FORMATS = {'JPG': 'JPEG'}
+FORMAT_EXTS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif'}
+
+
+def convert_image_file(src_path, dst_path, fmt=None, quality=85, max_dim=0):
+    """在转换进程中执行：解码 src_path，按需缩小，再以 fmt（None 表示保持原格式）写入 dst_path
+
+    返回 (输出文件的 SHA-256, 实际使用的格式)；动图不做处理，返回 (None, None)。
+    """
+    with Image.open(src_path) as img:
+        fmt = fmt or img.format
+        if getattr(img, 'is_animated', False):
+            return None, None
+        if img.format == 'JPEG':
+            # draft 让 JPEG 解码器直接输出 RGB，需要缩小时还能按 1/2、1/4、1/8 降采样解码
+            size = img.size
+            if max_dim and max(size) > max_dim:
+                scale = max_dim / max(size)
+                size = (max(1, int(size[0] * scale)), max(1, int(size[1] * scale)))
+            img.draft('RGB', size)
+        # 重新编码会丢掉 EXIF，先按方向信息把像素转正
+        img = ImageOps.exif_transpose(img)
+        if max_dim and max(img.size) > max_dim:
+            img.thumbnail((max_dim, max_dim), Image.LANCZOS)
+
+        transparent = img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+        if fmt == 'JPEG' and img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        elif fmt == 'WEBP' and img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if transparent else 'RGB')
+
+        if fmt == 'JPEG':
+            img.save(dst_path, fmt, quality=quality, optimize=True, progressive=True)
+        elif fmt == 'WEBP':
+            img.save(dst_path, fmt, quality=quality, method=4)
+        elif fmt == 'PNG':
+            img.save(dst_path, fmt, optimize=True)
+        else:
+            img.save(dst_path, fmt)
+    return AssetStore.hash_file(dst_path), fmt
+
+
+class ImageConverter:
+    """图片转换与优化流水线
+
+    下载线程只负责把图片写入磁盘，解码、缩放和编码在独立的进程池中进行，
+    不受 GIL 限制，也不占用网络工作线程。进程数就是同时转换的图片数上限，
+    排队中的图片只占磁盘不占内存。
+
+    fmt 为 None 时保持原格式（只缩放/重新压缩）；keep_smaller 为真时，
+    重新编码后反而变大的图片保留原图。
+    """
+    def __init__(self, fmt=None, quality=85, max_dim=0, keep_smaller=True, max_workers=None):
+        self.fmt = PIL_FORMATS.get(fmt, fmt) if fmt else None
+        self.quality = quality
+        self.max_dim = max_dim
+        self.keep_smaller = keep_smaller
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.pool = None
+        self._lock = threading.Lock()
+        self.converted = 0
+        self.kept = 0
+        self.failed = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    def submit(self, src_path, dst_path):
+        with self._lock:
+            # 第一张图片到来时才启动进程池
+            if self.pool is None:
+                self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers)
+        return self.pool.submit(convert_image_file, src_path, dst_path, self.fmt, self.quality, self.max_dim)
+
+    def record(self, outcome, before=0, after=0):
+        """outcome 为 converted / kept / failed，before/after 为处理前后的字节数"""
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            self.bytes_before += before
+            self.bytes_after += after
+
+    def summary(self):
+        saved = (self.bytes_before - self.bytes_after) / 1024 / 1024
+        return (f"🖼️ 图片优化: 重新编码 {self.converted} 张, 保留原图 {self.kept} 张, 失败 {self.failed} 张, "
+                f"{self.bytes_before / 1024 / 1024:.1f} MB -> {self.bytes_after / 1024 / 1024:.1f} MB, "
+                f"节省 {saved:.1f} MB ({self.max_workers} 个转换进程)")
+
+    def close(self, cancel=False):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=cancel)
+
+# ================= 性能统计 =================
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)   # 首字节延迟直方图各桶的上限（秒）
+
+PHASE_LABELS = {
+    'page_fetch': '页面下载', 'parse': '解析', 'rewrite': '改写', 'page_write': '写页面',
+    'asset_fetch': '资源下载', 'store': '写入对象库', 'convert': '图片转换',
+    'dns': 'DNS', 'tcp_connect': 'TCP 连接', 'tls_handshake': 'TLS 握手', 'connect': '建立连接',
+    'host_queue': '主机排队', 'queue_wait': '线程池排队',
+}
+
+class TaskMetrics:
+    """任务级性能统计：各阶段耗时、按主机的首字节延迟直方图、传输速率、线程池排队时间和利用率
+
+    只在请求、页面和线程池任务的边界上计时，不对每个数据块计时。
+    任务结束时 report() 生成 JSON 报告，summary() 生成日志摘要。
+    """
+    REPORT_NAME = 'crawl_report.json'
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.phases = {}
+        self.hosts = {}
+        self.pages = []
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self._t0
+
+    def phase(self, name, seconds):
+        with self._lock:
+            st = self.phases.setdefault(name, {'count': 0, 'total': 0.0, 'max': 0.0})
+            st['count'] += 1
+            st['total'] += seconds
+            st['max'] = max(st['max'], seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase(name, time.perf_counter() - t0)
+
+    def fetch(self, url, latency, nbytes=0, transfer=0.0, kind='asset'):
+        """登记一次成功收到响应的请求：latency 为首字节延迟，transfer 为读取响应体的耗时"""
+        self.phase(f"{kind}_fetch", latency + transfer)
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, latency)
+        with self._lock:
+            st = self.hosts.setdefault(urlparse(url).netloc.lower(), {
+                'requests': 0, 'bytes': 0, 'latency': 0.0, 'max_latency': 0.0, 'transfer': 0.0,
+                'histogram': [0] * (len(LATENCY_BUCKETS) + 1)})
+            st['requests'] += 1
+            st['bytes'] += nbytes
+            st['latency'] += latency
+            st['max_latency'] = max(st['max_latency'], latency)
+            st['transfer'] += transfer
+            st['histogram'][bucket] += 1
+
+    def page(self, url, fetch_ms, parse_ms, rewrite_ms, refs):
+        with self._lock:
+            self.pages.append({'url': url, 'fetch_ms': round(fetch_ms, 1), 'parse_ms': round(parse_ms, 1),
+                               'rewrite_ms': round(rewrite_ms, 1), 'refs': refs})
+
+    def queued(self, func):
+        """包装提交到线程池的函数，记录排队等待时间和工作线程的忙碌时间"""
+        submitted = time.perf_counter()
+
+        def run(*args):
+            started = time.perf_counter()
+            self.phase('queue_wait', started - submitted)
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self.busy += time.perf_counter() - started
+        return run
+
+    @staticmethod
+    def percentile(histogram, q, max_value):
+        """按直方图估算分位数：取所在桶的上限（秒），不超过实际最大值"""
+        target, seen = sum(histogram) * q, 0
+        for bound, count in zip(LATENCY_BUCKETS, histogram):
+            seen += count
+            if seen >= target: return min(bound, max_value)
+        return max_value
+
+    @staticmethod
+    def _ms(seconds):
+        return round(seconds * 1000, 1)
+
+    def report(self, **extra):
+        """生成 JSON 报告；extra 为引擎补充的任务信息（网址、保存数量等）"""
+        elapsed = self.elapsed
+        with self._lock:
+            phases = {name: {'count': st['count'], 'total_s': round(st['total'], 3),
+                             'avg_ms': self._ms(st['total'] / st['count']), 'max_ms': self._ms(st['max'])}
+                      for name, st in self.phases.items()}
+            hosts = {}
+            for host, st in self.hosts.items():
+                labels = [f"<={bound * 1000:g}ms" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1] * 1000:g}ms"]
+                hosts[host] = {
+                    'requests': st['requests'], 'bytes': st['bytes'],
+                    'avg_latency_ms': self._ms(st['latency'] / st['requests']),
+                    'max_latency_ms': self._ms(st['max_latency']),
+                    'p50_latency_ms': self._ms(self.percentile(st['histogram'], 0.5, st['max_latency'])),
+                    'p90_latency_ms': self._ms(self.percentile(st['histogram'], 0.9, st['max_latency'])),
+                    'bytes_per_s': round(st['bytes'] / st['transfer']) if st['transfer'] else None,
+                    'latency_histogram': dict(zip(labels, st['histogram'])),
+                }
+            pages = list(self.pages)
+            busy = self.busy
+        return dict(extra, started=time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started)),
+                    elapsed_s=round(elapsed, 3),
+                    workers={'count': self.workers, 'busy_s': round(busy, 3),
+                             'utilization': round(busy / (self.workers * elapsed), 3) if elapsed else 0},
+                    phases=phases, hosts=hosts, pages=pages)
+
+    def save(self, task_dir, report):
+        path = os.path.join(task_dir, self.REPORT_NAME)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return path
+
+    def summary(self, report, top=3):
+        total = report.get('bytes', 0)
+        elapsed = report['elapsed_s'] or 1
+        lines = [f"⏱️ 性能统计: 用时 {report['elapsed_s']:.1f}s, 下载 {total / 1024 / 1024:.1f} MB "
+                 f"({total / elapsed / 1024 / 1024:.2f} MB/s), 线程利用率 {report['workers']['utilization'] * 100:.0f}%"
+                 f" (报告: {self.REPORT_NAME})"]
+        phases = [f"{PHASE_LABELS.get(name, name)} {st['count']} 次 平均 {st['avg_ms']:.0f}ms"
+                  for name, st in report['phases'].items()]
+        if phases: lines.append("   阶段耗时: " + ", ".join(phases))
+        slowest = sorted(report['hosts'].items(), key=lambda item: -item[1]['p90_latency_ms'])[:top]
+        for host, st in slowest:
+            rate = f", {st['bytes_per_s'] / 1024 / 1024:.2f} MB/s" if st['bytes_per_s'] else ""
+            lines.append(f"   {host}: 请求 {st['requests']} 次, 首字节 平均 {st['avg_latency_ms']:.0f}ms / "
+                         f"P90 {st['p90_latency_ms']:.0f}ms / 最慢 {st['max_latency_ms']:.0f}ms{rate}")
+        return "\n".join(lines)
+
+# ================= 核心下载逻辑 =================
+
+class PageTask:
+    """调度器中单个页面的处理状态"""
+    def __init__(self, url, depth):
+        self.url = url
+        self.depth = depth
+        self.doc = None
+        self.parser = None
+        self.refs = []       # 去重后的 (abs_url, folder)
+        self.rewrites = []   # (kind, tag, attr, key) 保存时需要改写的位置
+        self.futures = []    # 与 refs 一一对应的下载 Future
+        self.parse_ms = 0.0
+        self.fetch_ms = 0.0
+        self.links = []
+        self.pending = 0
+
+class CoreDownloader:
+    """多线程下载引擎
+
+    params 为下载参数字典；sink 接收日志、进度和错误事件（默认打印到标准输出）。
+    调用 start() 后阻塞直到任务完成。
+    """
+    RANGE_THRESHOLD = 16 * 1024 * 1024   # 超过该大小的文件改用分段下载
+    RANGE_MIN_SEGMENT = 4 * 1024 * 1024  # 每段最小字节数；视频至少有一段这么大才分段
+    RANGE_MAX_SEGMENTS = 4
+    RANGE_RETRIES = 3
+    ENGINE = 'thread'
+
+    def __init__(self, params, sink=None):
+        self.sink = sink or DownloadSink()
+        self.start_url = params['url']
+        self.output_dir = params['output_dir']
+        self.max_depth = params['depth']
+        self.mode = params['mode']
+        # 格式转换或缩放任一开启时，图片都要经过转换流水线
+        self.convert_images = params['convert_img'] or params.get('img_max_dim', 0) > 0
+        self.allow_img = params['filter_img']
+        self.allow_video = params['filter_video']
+        self.max_workers = params.get('max_workers', 6)
+
+        self.ua = UserAgent()
+        self.urls = UrlCanonicalizer.from_params(params.get('url_rules'))
+        self.metrics = TaskMetrics(self.max_workers)
+        self.http = SessionPool(pool_size=self.max_workers, on_connect=self.metrics.phase)
+        # 批量任务共享同一个预算；单独运行时只限制本任务
+        self.budget = params.get('budget') or TransferBudget(self.max_workers)
+        # 批量任务共享同一个暂停/停止令牌
+        self.control = params.get('control') or TaskControl()
+        # 源站的并发上限不超过本任务的连接数，其他主机（CDN）单独计算
+        self.hosts = HostController(
+            self.start_url,
+            origin_max=params.get('origin_limit', self.max_workers),
+            host_max=params.get('per_host_limit', 16),
+            origin_rate=params.get('origin_rate', params.get('host_rate', 0)),
+            host_rate=params.get('host_rate', 0),
+            log=self.log,
+            should_stop=lambda: self.control.cancelled)
+        self.control.add_cancel_callback(self.hosts.wake)
+        self.retry = RetryPolicy(params.get('retry_attempts', 3))
+        self.limits = CrawlLimits(
+            max_pages=params.get('max_pages', 0),
+            max_bytes=params.get('max_bytes', 0),
+            max_file_size=params.get('max_file_size', 0),
+            time_limit=params.get('time_limit', 0),
+            log=self.log,
+            clock=self.control.clock)
+        self.stylesheets = StylesheetGraph()
+        self.executor = None
+        self.segment_pool = None
+        self.no_ranges = set()
+        self.asset_futures = {}
+        self._asset_lock = threading.Lock()
+
+        # 内容寻址对象库：默认放在任务目录的上一级，供同一保存路径下的所有任务共享
+        store_dir = params.get('store_dir') or os.path.join(
+            os.path.dirname(os.path.abspath(self.output_dir)), '.asset_store')
+        self.store = AssetStore(store_dir)
+        self.url_results = {}
+        self.digest_paths = {}
+        self.stylesheet_digests = {}   # 已放入任务目录、尚未改写完成的样式表: url -> digest
+        self._place_lock = threading.Lock()
+        self.names = FilenameAllocator(self.output_dir)
+        self.parser = PARSER_BACKENDS.get(params.get('parser', 'lxml'), SoupParser)()
+        self.fallback_parser = SoupParser()
+        self.encoding_stats = {}
+        self._stats_lock = threading.Lock()
+        self.pages_saved = 0
+        self.files_saved = 0
+        # 响应式图片默认只下载最大的一个版本，'all' 下载 srcset 中的全部版本
+        self.variant_policy = params.get('image_variants', 'largest')
+        self.variants_skipped = 0
+        self.filtered_by_type = 0
+
+        self.images = ImageConverter(
+            params['target_fmt'].upper() if params['convert_img'] else None,
+            quality=params.get('img_quality', 85),
+            max_dim=params.get('img_max_dim', 0),
+            keep_smaller=params.get('img_keep_smaller', True),
+            max_workers=params.get('convert_workers')) if self.convert_images else None
+
+        cache_dir = params.get('cache_dir')
+        self.cache = HttpCache(cache_dir, params.get('cache_max_mb', 1024) * 1024 * 1024) if cache_dir else None
+
+        if not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
+        self.journal = CrawlJournal(self.output_dir)
+        self.completed = False
+
+        self.media_exts = {
+            'img': ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg'],
+            'video': ['.mp4', '.webm', '.mkv', '.avi', '.mov']
+        }
+
+    def log(self, msg, tag="info"):
+        self.sink.log(msg, tag)
+
+    def resource_done(self, url, rel_path):
+        if rel_path is None: return
+        with self._stats_lock:
+            self.files_saved += 1
+        self.sink.progress('file_saved', url=url, path=rel_path)
+
+    def get_headers(self):
+        return {'User-Agent': self.ua.random, 'Referer': self.start_url}
+
+    def request_headers(self, url, page=False):
+        """普通请求头加上跨任务缓存的条件请求头
+
+        页面和资源共用缓存键，页面请求只在缓存的是网页时发送条件请求头，
+        已缓存的图片、视频不会因为 304 被当成页面读取。
+        """
+        headers = self.get_headers()
+        if self.cache:
+            entry = self.cache.lookup(url) if page else None
+            if not page or (entry and self.is_page_type(url, entry[3])):
+                headers.update(self.cache.conditional_headers(url))
+        return headers
+
+    def restore_journal(self):
+        """从抓取日志恢复已完成的页面和资源，返回需要（重新）抓取的页面 [(url, depth)]"""
+        queued, saved, assets = self.journal.load()
+        if not queued and not saved:
+            self.journal.begin(self.start_url)
+            start_url = self.queue_page(self.start_url, 0)
+            return [(start_url, 0)]
+
+        for url, path in saved.items():
+            self.names.restore(url, '', path)
+        restored = 0
+        for url, folder, path, digest in assets:
+            if not os.path.exists(self.names.local_path(path)): continue
+            self.names.restore(url, folder, path)
+            self.digest_paths[digest] = path
+            self.url_results[(url, folder)] = path
+            restored += 1
+        for url in saved: self.urls.claim(url, 'page')
+        pending = []
+        for url, depth in queued:
+            self.urls.claim(url, 'page')
+            # 页面上限同样适用于续传的页面，超出的继续留在抓取日志中
+            if self.limits.admit_page(): pending.append((url, depth))
+        self.log(f"♻️ 从抓取日志继续: 已保存 {len(saved)} 个页面, 已有 {restored} 个资源, 待抓取 {len(pending)} 个页面", "info")
+        return pending
+
+    def queue_page(self, url, depth):
+        """登记新发现的页面，返回规范化后需要抓取的网址，已登记过或超出页面上限的返回 None"""
+        url, new = self.urls.claim(url, 'page')
+        if not new: return None
+        # 超出页面上限的页面也记入抓取日志，下次运行（如提高上限后）继续抓取
+        self.journal.page_queued(url, depth)
+        return url if self.limits.admit_page() else None
+
+    @contextlib.contextmanager
+    def abort_on_stop(self, resp):
+        """停止时中止传输中的响应，线程引擎的停止不必等到读超时
+
+        中止引起的连接错误转换为 TaskCancelled，不重试也不计入连接错误。
+        """
+        abort = lambda: abort_response(resp)
+        self.control.add_cancel_callback(abort)
+        try:
+            if self.control.cancelled: abort()
+            yield resp
+        except Exception:
+            if self.control.cancelled: raise TaskCancelled("任务已停止")
+            raise
+        finally:
+            self.control.remove_cancel_callback(abort)
+        # 中止后读到的可能只是截断的响应体
+        if self.control.cancelled: raise TaskCancelled("任务已停止")
+
+    @contextlib.contextmanager
+    def request_slot(self, url):
+        """依次取得主机名额和全局连接名额；等待期间任务被停止（或暂停）时不再发出请求"""
+        with self.hosts.slot(url) as slot, self.budget.connection():
+            self.control.check()
+            yield slot
+
+    def transfer(self, nbytes, received=None):
+        """登记传输的字节：计入带宽预算和抓取上限，received 为当前文件已写入的字节数
+
+        同时检查暂停/停止令牌，暂停时在这里阻塞，停止时抛出 TaskCancelled 中止传输。
+        """
+        self.control.check()
+        if not self.budget.throttle(nbytes, self.control.sleep): raise TaskCancelled("任务已停止")
+        self.limits.add_bytes(nbytes)
+        self.limits.check(received)
+
+    def close_task_resources(self):
+        self.control.remove_cancel_callback(self.hosts.wake)
+        self.journal.close(self.completed)
+        if self.segment_pool:
+            self.segment_pool.shutdown()
+        if self.images:
+            self.images.close(self.control.cancelled)
+            self.log(self.images.summary(), "info")
+        self.log(self.urls.summary(), "info")
+        self.log(self.hosts.summary(), "info")
+        self.log(self.retry.summary(), "info")
+        if self.limits.enabled:
+            self.log(self.limits.summary(), "warning" if self.limits.reason else "info")
+        if self.stylesheets.processed:
+            self.log(self.stylesheets.summary(), "info")
+        if self.filtered_by_type:
+            self.log(f"🏷️ 按内容类型过滤: {self.filtered_by_type} 个资源只读取了响应头", "info")
+        if self.variants_skipped:
+            self.log(f"🖼️ 响应式图片: 只下载最大版本, 跳过 {self.variants_skipped} 处其他尺寸的引用", "info")
+        self.log(self.encoding_summary(), "info")
+        self.log(self.store.summary(), "info")
+        self.write_report()
+        self.store.close()
+        if self.cache:
+            self.log(self.cache.summary(), "info")
+            self.cache.close()
+        self.sink.progress('finished', output_dir=self.output_dir,
+                           pages=self.pages_saved, files=self.files_saved)
+
+    def write_report(self):
+        """把性能统计写入任务目录的 crawl_report.json，并在日志中输出摘要"""
+        report = self.metrics.report(
+            url=self.start_url, engine=self.ENGINE, completed=self.completed,
+            stopped=self.limits.reason or ("已停止" if self.control.cancelled else None),
+            pages_saved=self.pages_saved, files_saved=self.files_saved, bytes=self.limits.bytes,
+            connections={'reused': self.http.hits, 'new': self.http.misses})
+        try:
+            self.metrics.save(self.output_dir, report)
+        except OSError as e:
+            self.log(f"⚠️ 性能报告保存失败: {e}", "warning")
+        self.log(self.metrics.summary(report), "info")
+
+    # 引用资源的标签决定的保存目录也能说明类型（如 <img src="photo?id=3">）
+    FOLDER_KINDS = {'images': 'img', 'videos': 'video'}
+    # 不能说明具体类型的 Content-Type，此时退回按扩展名判断
+    GENERIC_TYPES = ('', 'application/octet-stream', 'binary/octet-stream', 'application/unknown')
+
+    def resource_kind(self, url, sub_folder, content_type=None):
+        """判断资源类型，返回 'img' / 'video' / None（其他）
+
+        依次参考响应的 Content-Type、路径（不含查询参数）的扩展名和保存目录。
+        """
+        mime = (content_type or '').split(';')[0].strip().lower()
+        if mime.startswith('image/'): return 'img'
+        if mime.startswith('video/'): return 'video'
+        if mime not in self.GENERIC_TYPES: return None
+        path = urlparse(url).path.lower()
+        if path.endswith(tuple(self.media_exts['img'])): return 'img'
+        if path.endswith(tuple(self.media_exts['video'])): return 'video'
+        return self.FOLDER_KINDS.get(sub_folder)
+
+    def kind_allowed(self, kind):
+        if kind == 'img': return self.allow_img
+        if kind == 'video': return self.allow_video
+        return self.mode != 'media_only'
+
+    def plan_resource(self, url, sub_folder):
+        """按过滤规则决定资源是否下载
+
+        返回 (显示名, 类型)，被过滤时返回 None。响应头到达后还会由
+        accept_response 按 Content-Type 再判断一次。
+        实际文件名在响应头到达后由 FilenameAllocator 分配。
+        """
+        kind = self.resource_kind(url, sub_folder)
+        if not self.kind_allowed(kind): return None
+        return unquote(os.path.basename(urlparse(url).path)) or url, kind
+
+    def accept_response(self, url, sub_folder, plan, headers):
+        """响应头到达后按 Content-Type 重新判断类型，返回 (是否下载, 类型)
+
+        被过滤的资源直接关闭响应，不读取响应体；超过单文件大小上限时抛出 BudgetExceeded。
+        """
+        self.limits.check_length(headers)
+        content_type = headers.get('Content-Type')
+        filename, expected = plan
+        kind = self.resource_kind(url, sub_folder, content_type)
+        mime = (content_type or '').split(';')[0].strip().lower()
+        if expected and mime == 'text/html':
+            # 图片/视频地址返回了网页，一般是登录页或软 404
+            reason = "返回的是网页"
+        elif not self.kind_allowed(kind):
+            reason = "类型已过滤"
+        else:
+            return True, kind
+        with self._stats_lock:
+            self.filtered_by_type += 1
+        self.log(f"   ⏭️ {reason}，不下载: {filename} ({mime or '未知类型'})", "file")
+        return False, kind
+
+    # 按网页解析的 Content-Type；其他明确的类型（视频、PDF 等）不当作页面
+    PAGE_TYPES = ('text/html', 'application/xhtml+xml')
+
+    def accept_page(self, url, headers):
+        """页面响应头到达后检查单文件大小上限和 Content-Type，不是网页时返回 False，不读取响应体
+
+        超过单文件大小上限时抛出 BudgetExceeded。
+        """
+        self.limits.check_length(headers)
+        return self.check_page_type(url, headers.get('Content-Type'))
+
+    def accept_cached_page(self, url):
+        """页面返回 304 时按缓存条目的类型和大小做同样的检查，缓存条目已失效时返回 False"""
+        entry = self.cache.lookup(url)
+        if entry is None: return False
+        _, _, _, content_type, size = entry
+        self.limits.check(size)
+        return self.check_page_type(url, content_type)
+
+    def is_page_type(self, url, content_type):
+        mime = (content_type or '').split(';')[0].strip().lower()
+        if mime in self.PAGE_TYPES: return True
+        # 没有可用的 Content-Type 时按扩展名判断，<a href="movie.mp4"> 不会被当成网页保存
+        return mime in self.GENERIC_TYPES and self.resource_kind(url, None, content_type) is None
+
+    def check_page_type(self, url, content_type):
+        if self.is_page_type(url, content_type): return True
+        mime = (content_type or '').split(';')[0].strip().lower()
+        self.log(f"   ⏭️ 不是网页，跳过: {url} ({mime or '未知类型'})", "file")
+        return False
+
+    def skip_page(self, url, e):
+        """页面超出抓取上限时跳过，仍留在抓取日志中"""
+        self.limits.drop_pages(1)
+        self.log(f"   ⏭️ {e.reason}，跳过页面: {url}", "file")
+
+    def should_convert(self, url, is_img, content_type=None):
+        # SVG 是矢量图，不经过转换流水线
+        if content_type and 'svg' in content_type.lower(): return False
+        return is_img and self.convert_images and not urlparse(url).path.lower().endswith('.svg')
+
+    def convert_image(self, src_path, url, sub_folder, content_type=None):
+        """把已写入磁盘的图片交给转换进程池，返回一个结果为相对路径的 Future
+
+        src_path 由这里接管：转换完成后删除，转换失败时按原图保存。
+        """
+        dst_path = self.store.temp_path()
+        result = concurrent.futures.Future()
+        submitted = time.perf_counter()
+
+        def converted(future):
+            # 包含在转换进程池中排队的时间
+            self.metrics.phase('convert', time.perf_counter() - submitted)
+            try:
+                before = os.path.getsize(src_path)
+                try:
+                    digest, fmt = future.result()
+                    after = os.path.getsize(dst_path) if digest else before
+                except Exception as img_error:
+                    self.images.record('failed', before, before)
+                    self.log(f"   ⚠️ 图片转换失败: {img_error}", "warning")
+                    result.set_result(self.place_file(src_path, url, sub_folder, content_type))
+                    return
+                if digest is None or (self.images.keep_smaller and after >= before):
+                    # 动图，或重新编码反而更大时保留原图
+                    self.images.record('kept', before, before)
+                    result.set_result(self.place_file(src_path, url, sub_folder, content_type))
+                else:
+                    self.images.record('converted', before, after)
+                    result.set_result(self.place_file(dst_path, url, sub_folder, digest=digest,
+                                                      ext=FORMAT_EXTS.get(fmt, f".{fmt.lower()}"), original=False))
+            except Exception as e:
+                self.log(f"   ⚠️ 下载错误: {str(e)}", "warning")
+                result.set_result(None)
+            finally:
+                remove_quietly(src_path)
+                remove_quietly(dst_path)
+
+        self.images.submit(src_path, dst_path).add_done_callback(converted)
+        return result
+
+    @staticmethod
+    def expand_future(future):
+        """资源下载的结果可能是图片转换阶段的 Future，展开成最终的相对路径"""
+        outer = concurrent.futures.Future()
+
+        def done(f):
+            if f.cancelled():
+                # 任务停止时排队中的下载被取消
+                outer.cancel()
+            elif f.exception() is not None:
+                outer.set_exception(f.exception())
+            elif isinstance(f.result(), concurrent.futures.Future):
+                f.result().add_done_callback(done)
+            else:
+                outer.set_result(f.result())
+
+        future.add_done_callback(done)
+        return outer
+
+    def place_file(self, tmp_path, url, sub_folder, content_type=None, digest=None, ext=None, original=True):
+        """把临时文件存入内容寻址对象库，再以硬链接形式放进任务目录
+
+        同一任务中内容相同的资源只落地一份，文件名由 FilenameAllocator 分配。
+        original 为 False（如转换后的图片）时对象不按 URL 登记。
+        """
+        with self.metrics.timer('store'):
+            if digest is None: digest = AssetStore.hash_file(tmp_path)
+            self.store.commit(tmp_path, digest, url if original else None)
+            return self.link_object(digest, url, sub_folder, content_type, ext)
+
+    def link_object(self, digest, url, sub_folder, content_type=None, ext=None):
+        """把对象库中的对象链接到任务目录，返回任务内相对路径"""
+        with self._place_lock:
+            relative_path = self.digest_paths.get(digest)
+            placed = relative_path is None
+            if placed:
+                relative_path = self.names.allocate(url, sub_folder, content_type, ext)
+                self.digest_paths[digest] = relative_path
+        if placed:
+            link_or_copy(self.store.object_path(digest), self.names.local_path(relative_path))
+        if sub_folder == 'css':
+            # 样式表等引用的资源下载完、路径改写后才记入抓取日志（见 stylesheet_done）
+            self.stylesheet_digests[url] = digest
+        else:
+            self.journal.asset_saved(url, sub_folder, relative_path, digest)
+        return relative_path
+
+    def stylesheet_done(self, url, rel_path):
+        """样式表处理完成后记入抓取日志；中途停止或中断的样式表续传时重新下载和处理"""
+        digest = self.stylesheet_digests.pop(url, None)
+        if digest is not None and not self.control.cancelled:
+            self.journal.asset_saved(url, 'css', rel_path, digest)
+
+    def download_resource(self, url, sub_folder):
+        key = (url, sub_folder)
+        if key in self.url_results: return self.url_results[key]
+        result = self.download_with_retry(url, sub_folder)
+        if sub_folder == 'css' and isinstance(result, str):
+            result = self.process_stylesheet(url, result)
+        self.url_results[key] = result
+        return result
+
+    def plan_fetch(self, url, sub_folder):
+        """负缓存中已确认失败的资源直接跳过，否则返回 plan_resource 的结果"""
+        if self.control.cancelled: return None
+        if self.limits.exhausted:
+            self.limits.skip_file()
+            return None
+        reason = self.retry.known_failure(url)
+        if reason:
+            self.log(f"   ⏭️ 跳过已知失败的资源 ({reason}): {url}", "file")
+            return None
+        return self.plan_resource(url, sub_folder)
+
+    def retry_delay(self, url, attempt, e):
+        """第 attempt 次尝试失败后的处理：需要重试时返回等待秒数，否则记录失败并返回 None"""
+        if isinstance(e, TaskCancelled) or self.control.cancelled:
+            return None
+        if isinstance(e, BudgetExceeded):
+            self.limits.skip_file()
+            self.log(f"   ⏭️ {e.reason}，跳过: {url}", "file")
+            return None
+        transient, reason, whole_host = self.retry.classify(e)
+        if transient and attempt + 1 < self.retry.attempts:
+            delay = self.retry.delay(attempt, e)
+            self.retry.record_retry()
+            self.log(f"   🔁 {reason}，{delay:.1f}s 后重试: {url}", "file")
+            return delay
+        # 重试用尽的瞬时错误同样记入负缓存，其他页面以不同保存目录引用它时不再请求
+        self.retry.remember(url, reason, whole_host)
+        self.log(f"   ⚠️ 下载失败 ({reason}): {url}", "warning")
+        return None
+
+    def download_with_retry(self, url, sub_folder):
+        """瞬时错误按退避策略重试，永久错误记入负缓存，同一任务中不再请求"""
+        # 同一网址出现在不同目录时先等前一个请求结束，失败结果可以直接复用
+        waiting = self.retry.begin(url)
+        while waiting:
+            waiting.wait()
+            waiting = self.retry.begin(url)
+        try:
+            # 暂停时不开始新的请求
+            if not self.control.wait(): return None
+            plan = self.plan_fetch(url, sub_folder)
+            if plan is None: return None
+            for attempt in range(self.retry.attempts):
+                try:
+                    result = self._download_resource(url, sub_folder, plan)
+                    if attempt: self.retry.record_recovered()
+                    return result
+                except Exception as e:
+                    delay = self.retry_delay(url, attempt, e)
+                    if delay is None or not self.control.sleep(delay): return None
+        finally:
+            self.retry.end(url)
+
+    def _download_resource(self, url, sub_folder, plan):
+        """下载单个资源（一次尝试），失败时抛出异常交给 download_with_retry 处理"""
+        tmp_path = None
+        try:
+            filename, kind = plan
+            self.log(f"   ⬇️ {filename}", "file")
+            with self.request_slot(url) as slot, \
+                    self.http.stream(url, headers=self.request_headers(url), timeout=10) as resp, \
+                    self.abort_on_stop(resp):
+                latency = resp.elapsed.total_seconds()
+                slot.done(resp.status_code, resp.headers, latency)
+                if resp.status_code == 304 and self.cache:
+                    return self.reuse_cached(url, sub_folder, kind == 'img')
+                if resp.status_code != 200:
+                    raise self.retry.http_error(resp.status_code, resp.headers)
+                headers = resp.headers
+                accepted, kind = self.accept_response(url, sub_folder, plan, headers)
+                if not accepted: return None
+                ranged = self.use_ranges(url, headers, kind)
+                if not ranged:
+                    tmp_path = self.store.temp_path()
+                    hasher = hashlib.sha256()
+                    t0 = time.perf_counter()
+                    with open(tmp_path, 'wb') as f:
+                        for chunk in resp.iter_content(chunk_size=65536):
+                            f.write(chunk)
+                            hasher.update(chunk)
+                            self.transfer(len(chunk), f.tell())
+                        self.metrics.fetch(url, latency, f.tell(), time.perf_counter() - t0)
+                    self.check_length(headers, tmp_path)
+                    digest = hasher.hexdigest()
+            if ranged:
+                # 探测用的响应已关闭，大文件按字节范围分段并行下载
+                tmp_path, digest = self.download_ranged(url, headers, filename)
+
+            if self.should_convert(url, kind == 'img', headers.get('Content-Type')):
+                # 原图已落盘，转换交给进程池，下载线程立即返回
+                if self.cache: self.cache.store(url, headers, src_path=tmp_path)
+                src_path, tmp_path = tmp_path, None
+                return self.convert_image(src_path, url, sub_folder, headers.get('Content-Type'))
+            relative_path = self.place_file(tmp_path, url, sub_folder, headers.get('Content-Type'), digest)
+            tmp_path = None
+            if self.cache: self.cache.store(url, headers, src_path=self.store.object_path(digest))
+            return relative_path
+        finally:
+            if tmp_path: remove_quietly(tmp_path)
+
+    @staticmethod
+    def check_length(headers, path):
+        """响应未压缩且带 Content-Length 时核对写入的字节数，截断的文件不会被当成完整文件"""
+        expected = headers.get('Content-Length')
+        if expected and expected.isdigit() and not headers.get('Content-Encoding'):
+            actual = os.path.getsize(path)
+            if actual != int(expected):
+                raise FetchError(f"下载不完整: {actual}/{expected} 字节", transient=True)
+
+    def use_ranges(self, url, headers, kind):
+        """服务器支持字节范围请求、长度已知且未压缩时，大文件和视频改用分段下载
+
+        分段请求曾被服务器拒绝过的 URL 直接整体下载。
+        """
+        if url in self.no_ranges: return False
+        if headers.get('Accept-Ranges', '').lower() != 'bytes' or headers.get('Content-Encoding'):
+            return False
+        length = headers.get('Content-Length', '')
+        if not length.isdigit(): return False
+        length = int(length)
+        return length >= self.RANGE_THRESHOLD or (kind == 'video' and length >= self.RANGE_MIN_SEGMENT)
+
+    def download_ranged(self, url, headers, filename):
+        """按字节范围分段并行下载大文件
+
+        每段写入对象库 partial 目录下自己的 .part 文件，中断后（包括下次任务）
+        从已有长度继续；全部完成后按顺序拼接到临时文件并核对总长度。
+        目录被其他任务占用时在临时目录中下载，不续传也不互相覆盖。
+        返回 (临时文件路径, SHA-256)。
+        """
+        part_dir, shared = self.store.claim_partial(url)
+        try:
+            return self._download_segments(url, headers, filename, part_dir)
+        except RangeUnsupported:
+            self.no_ranges.add(url)
+            raise
+        finally:
+            self.store.release_partial(part_dir, shared)
+
+    def _download_segments(self, url, headers, filename, part_dir):
+        length = int(headers['Content-Length'])
+        validator = headers.get('ETag') or headers.get('Last-Modified')
+        meta_path = os.path.join(part_dir, 'meta.json')
+        meta = {'url': url, 'length': length, 'validator': validator}
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                resumable = json.load(f) == meta
+        except (OSError, ValueError):
+            resumable = False
+        if not resumable:
+            # 没有续传记录或远端文件已变化，从头开始
+            shutil.rmtree(part_dir, ignore_errors=True)
+            os.makedirs(part_dir)
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+
+        count = max(1, min(self.RANGE_MAX_SEGMENTS, length // self.RANGE_MIN_SEGMENT))
+        segments = [(os.path.join(part_dir, f"{i}.part"), i * length // count, (i + 1) * length // count - 1)
+                    for i in range(count)]
+        resumed = sum(os.path.getsize(path) for path, _, _ in segments if os.path.exists(path))
+        self.log(f"   📦 分段下载: {filename} ({count} 段, {length / 1024 / 1024:.1f} MB"
+                 + (f", 续传 {resumed / 1024 / 1024:.1f} MB)" if resumed else ")"), "info")
+
+        with self._asset_lock:
+            if self.segment_pool is None:
+                self.segment_pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        futures = [self.segment_pool.submit(self.fetch_segment, url, validator, *segment) for segment in segments]
+        # 等所有分段结束再处理错误，释放目录时不会还有线程在写
+        concurrent.futures.wait(futures)
+        for future in futures:
+            future.result()
+
+        tmp_path = self.store.temp_path()
+        hasher = hashlib.sha256()
+        with open(tmp_path, 'wb') as out:
+            for path, _, _ in segments:
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                        out.write(chunk)
+                        hasher.update(chunk)
+        if os.path.getsize(tmp_path) != length:
+            remove_quietly(tmp_path)
+            shutil.rmtree(part_dir, ignore_errors=True)
+            raise FetchError(f"分段合并后长度不符: 应为 {length} 字节", transient=True)
+        shutil.rmtree(part_dir, ignore_errors=True)
+        return tmp_path, hasher.hexdigest()
+
+    def fetch_segment(self, url, validator, part_path, start, end):
+        """下载 [start, end] 字节范围并追加到 part_path，连接中断时从已写入的位置重试"""
+        error = None
+        for _ in range(self.RANGE_RETRIES):
+            done = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            if start + done > end: return
+            headers = self.get_headers()
+            headers['Range'] = f"bytes={start + done}-{end}"
+            # 远端文件变化时 If-Range 让服务器返回完整的 200 响应，而不是拼出错误的内容
+            if validator: headers['If-Range'] = validator
+            try:
+                with self.request_slot(url) as slot, \
+                        self.http.stream(url, headers=headers, timeout=10) as resp, \
+                        self.abort_on_stop(resp):
+                    slot.done(resp.status_code, resp.headers)
+                    if resp.status_code != 206:
+                        remove_quietly(part_path)
+                        if resp.status_code in (200, 416):
+                            # 服务器忽略或拒绝了 Range（包括 If-Range 校验失败），改为整体下载
+                            raise RangeUnsupported(f"服务器未按范围返回 (HTTP {resp.status_code})",
+                                                   status=resp.status_code)
+                        raise self.retry.http_error(resp.status_code, resp.headers)
+                    t0, received = time.perf_counter(), 0
+                    with open(part_path, 'ab') as f:
+                        for chunk in resp.iter_content(chunk_size=65536):
+                            f.write(chunk)
+                            received += len(chunk)
+                            self.transfer(len(chunk))
+                    self.metrics.fetch(url, resp.elapsed.total_seconds(), received, time.perf_counter() - t0)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                error = e
+        done = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if start + done <= end:
+            # 已写入的分段会保留，重试或下次任务从断点继续
+            raise FetchError(f"分段下载中断，已保留 {done} 字节: {error}", transient=True)
+
+    def reuse_cached(self, url, sub_folder, is_img):
+        """服务器返回 304 时从跨任务缓存中取出资源，需要转换的图片返回转换阶段的 Future"""
+        entry = self.cache.lookup(url)
+        content_type = entry[3] if entry else None
+        if self.should_convert(url, is_img, content_type):
+            src_path = self.store.temp_path()
+            if self.cache.materialize(url, src_path):
+                self.cache.record_hit(url)
+                return self.convert_image(src_path, url, sub_folder, content_type)
+            remove_quietly(src_path)
+        # 对象库里已有这个 URL 的内容时直接链接，省去一次复制和哈希
+        digest = self.store.lookup(url)
+        if digest is not None:
+            self.cache.record_hit(url)
+            return self.link_object(digest, url, sub_folder, content_type)
+        tmp_path = self.store.temp_path()
+        try:
+            if self.cache.materialize(url, tmp_path):
+                return self.place_file(tmp_path, url, sub_folder, content_type)
+        finally:
+            remove_quietly(tmp_path)
+        self.log(f"   ⚠️ 缓存条目已失效: {url}", "warning")
+        return None
+
+    def submit_resource(self, url, sub_folder):
+        """提交资源下载任务，同一任务内相同 URL 只下载一次（共享 Future）"""
+        key = (url, sub_folder)
+        with self._asset_lock:
+            future = self.asset_futures.get(key)
+            if future is None:
+                future = self.expand_future(self.submit_to_host(url, self.download_resource, url, sub_folder))
+                future.add_done_callback(lambda f: f.cancelled() or self.resource_done(url, f.result()))
+                self.asset_futures[key] = future
+            return future
+
+    def submit_to_host(self, url, func, *args):
+        """按 url 的主机排队提交到线程池，返回 Future
+
+        慢主机的名额用完时，它的工作在 HostController 的主机队列中等待，
+        不会占住共享的工作线程，其他主机（如 CDN）的资源照常下载。
+        """
+        future = concurrent.futures.Future()
+        queued = time.perf_counter()
+
+        def done(inner):
+            self.hosts.finished(url)
+            if inner.cancelled(): future.cancel()
+            elif inner.exception() is not None: future.set_exception(inner.exception())
+            else: future.set_result(inner.result())
+
+        def start():
+            if self.control.cancelled:
+                future.cancel()
+                return False
+            self.metrics.phase('host_queue', time.perf_counter() - queued)
+            try:
+                inner = self.executor.submit(self.metrics.queued(func), *args)
+            except RuntimeError:
+                # 任务停止后线程池已关闭，不再接受新的工作
+                future.cancel()
+                return False
+            inner.add_done_callback(done)
+            return True
+
+        self.hosts.dispatch(url, start)
+        return future
+
+    def stylesheet_refs(self, url, rel_path):
+        """读取已保存的样式表，返回 (文本, [(原始地址, 规范化地址, 保存目录, 是否 @import)])"""
+        with open(self.names.local_path(rel_path), 'rb') as f:
+            # surrogateescape 保证非 UTF-8 的字节改写后原样写回
+            text = f.read().decode('utf-8', 'surrogateescape')
+        refs = []
+        for raw, is_import in css_references(text):
+            try:
+                abs_url = self.urls.claim(urljoin(url, raw), 'asset')[0]
+            except ValueError:
+                continue
+            refs.append((raw, abs_url, 'css' if is_import else css_folder(abs_url), is_import))
+        return text, refs
+
+    def save_stylesheet(self, rel_path, text, resolved):
+        """把样式表中的地址改成相对于样式表所在目录的本地路径，resolved: 原始地址 -> 任务内相对路径
+
+        任务目录中的文件可能与对象库共用 inode，写入新文件后替换，不能原地改写。
+        """
+        base = posixpath.dirname(rel_path)
+
+        def local(raw):
+            target = resolved.get(raw)
+            return posixpath.relpath(target, base) if target else None
+
+        new_text = rewrite_css(text, local)
+        if new_text != text:
+            path = self.names.local_path(rel_path)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(new_text.encode('utf-8', 'surrogateescape'))
+            os.replace(tmp_path, path)
+        return rel_path
+
+    def stylesheet_children(self, url, refs, resolved):
+        """登记 @import 依赖，返回需要等待下载的 [(原始地址, 规范化地址, 保存目录)]
+
+        形成循环的 @import 不再等待，对方的文件位置已经确定，直接写入 resolved。
+        """
+        children = []
+        for raw, abs_url, folder, is_import in refs:
+            if is_import and not self.stylesheets.depend(url, abs_url):
+                resolved[raw] = self.stylesheets.paths.get(abs_url)
+                continue
+            children.append((raw, abs_url, folder))
+        self.stylesheets.count_assets(len(children))
+        return children
+
+    def process_stylesheet(self, url, rel_path):
+        """CSS 处理阶段：并发下载样式表引用的字体、图片和 @import 的样式表，全部完成后改写路径
+
+        返回结果为相对路径的 Future，由 expand_future 展开。
+        """
+        result = concurrent.futures.Future()
+        claimed = self.stylesheets.claim(url, rel_path, result)
+        if claimed is not result: return claimed
+
+        def finish():
+            try:
+                self.save_stylesheet(rel_path, text, resolved)
+                self.stylesheet_done(url, rel_path)
+                result.set_result(rel_path)
+            except Exception as e:
+                self.log(f"   ⚠️ 样式表改写失败: {e}", "warning")
+                result.set_result(rel_path)
+
+        resolved = {}
+        try:
+            text, refs = self.stylesheet_refs(url, rel_path)
+            children = self.stylesheet_children(url, refs, resolved)
+        except Exception as e:
+            self.log(f"   ⚠️ 样式表解析失败: {e}", "warning")
+            result.set_result(rel_path)
+            return result
+        if not children:
+            finish()
+            return result
+
+        pending = [len(children)]
+        lock = threading.Lock()
+
+        def child_done(raw, future):
+            if not future.cancelled() and future.exception() is None and future.result():
+                resolved[raw] = future.result()
+            with lock:
+                pending[0] -= 1
+                last = pending[0] == 0
+            if last: finish()
+
+        for raw, abs_url, folder in children:
+            self.submit_resource(abs_url, folder).add_done_callback(lambda f, raw=raw: child_done(raw, f))
+        return result
+
+    # 单次遍历时需要收集的属性: 标签 -> [(属性, 保存目录, 仅整页模式)]
+    # img 的 src/srcset 和懒加载属性由 collect_images 统一处理
+    REF_RULES = {
+        'video': [('src', 'videos', False), ('poster', 'images', False)],
+        'source': [('src', 'videos', False)],
+        'script': [('src', 'js', True)],
+    }
+    # <link> 按 rel / as 决定保存目录，canonical、alternate 等不是资源的不下载
+    LINK_REL_FOLDERS = {'stylesheet': 'css', 'icon': 'images', 'apple-touch-icon': 'images',
+                        'modulepreload': 'js'}
+    PRELOAD_AS_FOLDERS = {'style': 'css', 'script': 'js', 'image': 'images', 'font': 'fonts', 'video': 'videos'}
+
+    def link_folder(self, rel, as_type, mime_type=None):
+        rels = (rel or '').lower().split()
+        if not rels and 'css' in (mime_type or '').lower(): return 'css'
+        for token in rels:
+            if token in self.LINK_REL_FOLDERS: return self.LINK_REL_FOLDERS[token]
+        if 'preload' in rels or 'prefetch' in rels:
+            return self.PRELOAD_AS_FOLDERS.get((as_type or '').lower())
+        return None
+
+    SRCSET_TAGS = ('img', 'source')
+    # 常见懒加载脚本存放真实地址的属性
+    LAZY_SRC_ATTRS = ('data-src', 'data-original', 'data-lazy-src', 'data-lazy', 'data-url')
+    LAZY_SRCSET_ATTRS = ('data-srcset', 'data-lazy-srcset')
+
+    def object_folder(self, url, mime_type=None):
+        """<object data> 按类型或扩展名放进 images / videos，其他放进 files"""
+        mime_type = (mime_type or '').lower()
+        path = urlparse(urljoin(self.start_url, url or '')).path.lower()
+        if mime_type.startswith('image/') or path.endswith(tuple(self.media_exts['img'])): return 'images'
+        if mime_type.startswith('video/') or path.endswith(tuple(self.media_exts['video'])): return 'videos'
+        return 'files'
+
+    def image_variants(self, p, tag):
+        """返回元素上所有候选图片 [(属性, 原始地址, 宽度, 像素密度)]，懒加载属性排在前面"""
+        variants = []
+        for attr in self.LAZY_SRCSET_ATTRS + ('srcset',):
+            for raw, width, density in parse_srcset(p.get(tag, attr)):
+                if not raw.startswith('data:'):
+                    variants.append((attr, raw, width, density))
+        lazy = False
+        for attr in self.LAZY_SRC_ATTRS + ('src',):
+            raw = (p.get(tag, attr) or '').strip()
+            # 有懒加载地址时 src 只是占位图
+            if not raw or raw.startswith('data:') or (attr == 'src' and lazy): continue
+            lazy = lazy or attr != 'src'
+            variants.append((attr, raw, None, 1.0))
+        return variants
+
+    def collect_images(self, task, elements, add_ref):
+        """收集一个 <img>（或一个 <picture> 中全部 <source> 和 <img>）的图片引用
+
+        elements: [(元素, 标签名, 候选列表)]。默认只下载最宽/像素密度最高的一个版本，
+        并把所有 src、srcset 和懒加载属性都指向它；image_variants='all' 时下载全部版本。
+        """
+        variants = [v for _, _, candidates in elements for v in candidates]
+        if not variants: return
+        if self.variant_policy == 'all':
+            for tag, name, candidates in elements:
+                lazy_key = None
+                for attr in dict.fromkeys(attr for attr, _, _, _ in candidates):
+                    if attr == 'srcset' or attr in self.LAZY_SRCSET_ATTRS:
+                        for raw, _, _ in parse_srcset(task.parser.get(tag, attr)):
+                            add_ref(raw, 'images')
+                        task.rewrites.append(('srcset', tag, attr, None))
+                    else:
+                        key = add_ref(task.parser.get(tag, attr), 'images')
+                        task.rewrites.append(('attr', tag, attr, key))
+                        if attr != 'src' and lazy_key is None: lazy_key = key
+                if name == 'img' and lazy_key:
+                    task.rewrites.append(('attr', tag, 'src', lazy_key))
+            return
+
+        best = pick_variant(variants)
+        key = add_ref(best[1], 'images')
+        if key is None: return
+        skipped = len({raw for _, raw, _, _ in variants}) - 1
+        if skipped:
+            with self._stats_lock:
+                self.variants_skipped += skipped
+        for tag, name, candidates in elements:
+            attrs = dict.fromkeys(attr for attr, _, _, _ in candidates)
+            if name == 'img': attrs['src'] = None
+            for attr in attrs:
+                task.rewrites.append(('attr', tag, attr, key))
+
+    def decode_stage(self, body, content_type):
+        """识别页面编码并记录识别来源，返回交给解析器的编码名"""
+        encoding, source = sniff_encoding(body, content_type)
+        with self._stats_lock:
+            self.encoding_stats[source] = self.encoding_stats.get(source, 0) + 1
+        if source == 'detected':
+            self.log(f"   🔤 未声明编码，统计检测为 {encoding}", "warning")
+        return encoding
+
+    def encoding_summary(self):
+        labels = [('header', '响应头'), ('bom', 'BOM'), ('meta', 'meta'), ('utf-8', 'UTF-8 校验'), ('detected', '全文统计')]
+        parts = [f"{label} {self.encoding_stats.get(key, 0)}" for key, label in labels]
+        return "🔤 编码识别: " + ", ".join(parts)
+
+    def parse_page(self, task, body, content_type=None):
+        """识别编码后把原始字节交给解析器，完成引用收集并记录解析耗时
+
+        优先使用配置的解析后端，解析失败时退回 BeautifulSoup。
+        """
+        t0 = time.perf_counter()
+        encoding = self.decode_stage(body, content_type)
+        try:
+            doc = self.parser.parse(body, encoding)
+            task.parser = self.parser
+        except Exception:
+            doc = self.fallback_parser.parse(body, encoding)
+            task.parser = self.fallback_parser
+        self.extract_page(task, doc)
+        task.parse_ms = (time.perf_counter() - t0) * 1000
+        self.metrics.phase('parse', task.parse_ms / 1000)
+        return task
+
+    def extract_page(self, task, doc):
+        """单次遍历 DOM，收集资源引用、改写计划和同站链接，结果写入 task
+
+        task.refs 是去重后的 (abs_url, folder) 列表，对应一次下载；
+        task.rewrites 记录每处需要改写的位置，保存页面时按下载结果统一改写。
+        """
+        p = task.parser
+        full = self.mode == 'full'
+        collect_links = task.depth < self.max_depth
+        start_netloc = urlparse(self.urls.canonical(self.start_url)).netloc
+        index = {}
+        pictures = {}
+
+        def add_ref(raw, folder):
+            raw = (raw or '').strip()
+            if not raw or raw.startswith('data:'): return None
+            try:
+                key = (self.urls.claim(urljoin(task.url, raw), 'asset')[0], folder)
+            except ValueError:
+                # 端口越界、IPv6 地址不完整等无法解析的网址只跳过这一处引用
+                return None
+            if key not in index:
+                index[key] = len(task.refs)
+                task.refs.append(key)
+            return key
+
+        for tag in p.candidates(doc):
+            name = p.tag_name(tag)
+            for attr, folder, full_only in self.REF_RULES.get(name, ()):
+                if full_only and not full: continue
+                key = add_ref(p.get(tag, attr), folder)
+                if key: task.rewrites.append(('attr', tag, attr, key))
+
+            if name in self.SRCSET_TAGS:
+                parent = p.parent(tag)
+                # libxml2 不把 <source> 当作空元素，后面的兄弟节点会被嵌套进去
+                while parent is not None and p.tag_name(parent) == 'source':
+                    parent = p.parent(parent)
+                in_picture = parent is not None and p.tag_name(parent) == 'picture'
+                if in_picture:
+                    # <picture> 的 <source> 先攒着，遇到其中的 <img> 时一起挑选版本
+                    group = pictures.setdefault(id(parent), (parent, []))[1]
+                    group.append((tag, name, self.image_variants(p, tag)))
+                    if name == 'img':
+                        self.collect_images(task, pictures.pop(id(parent))[1], add_ref)
+                elif name == 'img':
+                    self.collect_images(task, [(tag, name, self.image_variants(p, tag))], add_ref)
+            elif name == 'link':
+                folder = self.link_folder(p.get(tag, 'rel'), p.get(tag, 'as'), p.get(tag, 'type'))
+                if folder and (full or folder in self.FOLDER_KINDS):
+                    key = add_ref(p.get(tag, 'href'), folder)
+                    if key: task.rewrites.append(('attr', tag, 'href', key))
+            elif name == 'object':
+                data = p.get(tag, 'data')
+                key = add_ref(data, self.object_folder(data, p.get(tag, 'type')))
+                if key: task.rewrites.append(('attr', tag, 'data', key))
+
+            if full:
+                text = p.text(tag) if name == 'style' else None
+                if text and 'url(' in text:
+                    for match in CSS_URL_RE.finditer(text):
+                        add_ref(match.group(2), 'images')
+                    task.rewrites.append(('css', tag, None, None))
+                style_attr = p.get(tag, 'style')
+                if style_attr and 'url(' in style_attr:
+                    for match in CSS_URL_RE.finditer(style_attr):
+                        add_ref(match.group(2), 'images')
+                    task.rewrites.append(('css', tag, 'style', None))
+
+            href = p.get(tag, 'href') if collect_links and name == 'a' else None
+            if href:
+                try:
+                    next_url = urljoin(task.url, href)
+                    same_site = urlparse(self.urls.canonical(next_url)).netloc == start_netloc
+                except ValueError:
+                    same_site = False
+                if same_site: task.links.append(next_url)
+
+        # 缺少 <img> 的 <picture>
+        for _, group in pictures.values():
+            self.collect_images(task, group, add_ref)
+        if full:
+            task.doc = doc
+        return task
+
+    def apply_rewrites(self, task, resolved):
+        """按下载结果就地改写 DOM，resolved: (abs_url, folder) -> 相对路径"""
+        p = task.parser
+
+        def local(raw, folder):
+            raw = raw.strip()
+            if not raw or raw.startswith('data:'): return None
+            try:
+                return resolved.get((self.urls.resolve(urljoin(task.url, raw)), folder))
+            except ValueError:
+                return None
+
+        def replace_css_url(match):
+            rel_path = local(match.group(2), 'images')
+            return f'url({rel_path})' if rel_path else match.group(0)
+
+        for kind, tag, attr, key in task.rewrites:
+            if kind == 'attr':
+                rel_path = resolved.get(key)
+                if rel_path: p.set(tag, attr, rel_path)
+            elif kind == 'srcset':
+                candidates = []
+                for raw, width, density in parse_srcset(p.get(tag, attr)):
+                    descriptor = f" {width}w" if width else (f" {density:g}x" if density != 1.0 else "")
+                    candidates.append((local(raw, 'images') or raw) + descriptor)
+                p.set(tag, attr, ', '.join(candidates))
+            elif kind == 'css':
+                if attr:
+                    p.set(tag, attr, CSS_URL_RE.sub(replace_css_url, p.get(tag, attr)))
+                else:
+                    p.set_text(tag, CSS_URL_RE.sub(replace_css_url, p.text(tag)))
+
+    def report_page_error(self, e):
+        error_msg = f"页面处理错误: {str(e)}"
+        error_details = traceback.format_exc()
+        self.log(f"❌ 页面错误: {e}", "error")
+        
+        # 严重错误单独回报，图形界面据此弹出对话框
+        if "ConnectionError" in str(e) or "Timeout" in str(e):
+            self.sink.error("网络错误", error_msg, error_details)
+
+    def process_page(self, url, depth):
+        """下载并解析页面，资源下载提交到共享线程池后立即返回（不等待）"""
+        task = PageTask(url, depth)
+        if not self.control.wait(): return task
+        if self.limits.exhausted:
+            self.limits.drop_pages(1)
+            return task
+        self.log(f"🌍 分析页面 [深度{depth}]: {url}", "info")
+        try:
+            with self.request_slot(url) as slot:
+                t0 = time.perf_counter()
+                with self.http.stream(url, headers=self.request_headers(url, page=True), timeout=10) as resp, \
+                        self.abort_on_stop(resp):
+                    latency = resp.elapsed.total_seconds()
+                    slot.done(resp.status_code, resp.headers, latency)
+                    if not self.urls.redirected(url, resp.url):
+                        self.log(f"   ↪️ 跳转到已抓取的页面，跳过: {resp.url}", "info")
+                        return task
+                    # 页面和资源一样流式读取，计入带宽预算和抓取上限
+                    chunks, received, t1 = [], 0, time.perf_counter()
+                    if resp.status_code == 200:
+                        if not self.accept_page(url, resp.headers): return task
+                        for chunk in resp.iter_content(chunk_size=65536):
+                            chunks.append(chunk)
+                            received += len(chunk)
+                            self.transfer(len(chunk), received)
+                    body = b''.join(chunks)
+                    task.fetch_ms = (time.perf_counter() - t0) * 1000
+                    self.metrics.fetch(url, latency, received, time.perf_counter() - t1, 'page')
+            if resp.status_code == 304 and self.cache:
+                if not self.accept_cached_page(url): return task
+                body, content_type = self.cache.read(url)
+                if body is None: return task
+                self.parse_page(task, body, content_type)
+            elif resp.status_code == 200:
+                if self.cache: self.cache.store(url, resp.headers, data=body)
+                self.parse_page(task, body, resp.headers.get('Content-Type'))
+            else:
+                return task
+            
+            task.futures = [self.submit_resource(abs_url, folder) for abs_url, folder in task.refs]
+        except TaskCancelled:
+            pass
+        except BudgetExceeded as e:
+            self.skip_page(url, e)
+        except Exception as e:
+            self.report_page_error(e)
+        return task
+
+    def save_page(self, task, rel_paths):
+        """资源全部完成后修正引用并保存页面，rel_paths 与 task.refs 一一对应"""
+        try:
+            # 停止后部分资源没有下载，页面不保存，仍留在抓取日志中等待下次继续
+            if self.control.cancelled: return
+            t0 = time.perf_counter()
+            self.apply_rewrites(task, dict(zip(task.refs, rel_paths)))
+            html = task.parser.serialize(task.doc)
+            rewrite_ms = (time.perf_counter() - t0) * 1000
+            self.metrics.phase('rewrite', rewrite_ms / 1000)
+            
+            page_name = self.names.allocate_page(task.url)
+            with self.metrics.timer('page_write'), \
+                    open(self.names.local_path(page_name), 'w', encoding='utf-8') as f:
+                f.write(html)
+            self.metrics.page(task.url, task.fetch_ms, task.parse_ms, rewrite_ms, len(task.refs))
+            self.log(f"✅ 保存页面: {page_name} (解析 {task.parse_ms:.0f}ms, 改写 {rewrite_ms:.0f}ms)", "success")
+            with self._stats_lock:
+                self.pages_saved += 1
+            self.journal.page_saved(task.url, page_name)
+            self.sink.progress('page_saved', url=task.url, path=page_name)
+        except Exception as e:
+            self.log(f"❌ 页面保存失败: {e}", "error")
+        finally:
+            # 释放 DOM，避免已完成页面继续占用内存
+            task.doc = None
+            task.refs = []
+            task.rewrites = []
+            task.futures = []
+
+    def run_scheduler(self):
+        """广度优先调度：frontier 中的页面和所有资源共享同一个线程池
+
+        调度状态只在当前线程中修改，工作线程通过完成事件队列回报结果。
+        暂停时不展开新页面；停止时取消线程池中排队的工作并立即返回。
+        """
+        frontier = deque(self.restore_journal())
+        events = queue.Queue()
+        outstanding = 0      # 尚未回报的 Future 数量
+        active_pages = 0     # 已出队但尚未保存完成的页面数量
+
+        def finish(task):
+            nonlocal outstanding, active_pages
+            if task.doc is None:
+                active_pages -= 1
+                return
+            outstanding += 1
+            # 停止时排队中的资源下载被取消，取消或出错的引用按下载失败处理
+            rel_paths = [None if future.cancelled() or future.exception() else future.result()
+                         for future in task.futures]
+            self.executor.submit(self.metrics.queued(self.save_page), task, rel_paths).add_done_callback(
+                lambda f: events.put(('saved', task)))
+
+        while frontier or outstanding:
+            if not self.control.wait():
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.log(f"⏹️ 任务已停止，{len(frontier) + active_pages} 个未完成的页面保留在抓取日志中", "warning")
+                return
+            # 限制同时展开的页面数，避免大量 DOM 同时驻留内存
+            if frontier and self.limits.exhausted:
+                # 预算用尽：不再展开新页面，它们仍记录在抓取日志中，下次可以继续
+                self.limits.drop_pages(len(frontier))
+                frontier.clear()
+            while frontier and active_pages < self.max_workers:
+                url, depth = frontier.popleft()
+                active_pages += 1
+                outstanding += 1
+                self.submit_to_host(url, self.process_page, url, depth).add_done_callback(
+                    lambda f: f.cancelled() or events.put(('parsed', f.result())))
+
+            # 定时醒来检查令牌，停止和暂停不必等到下一个事件
+            try:
+                kind, task = events.get(timeout=self.control.CHECK_INTERVAL)
+            except queue.Empty:
+                continue
+            outstanding -= 1
+
+            if kind == 'parsed':
+                for link in task.links:
+                    next_url = self.queue_page(link, task.depth + 1)
+                    if next_url: frontier.append((next_url, task.depth + 1))
+                task.pending = len(task.futures)
+                if not task.pending:
+                    finish(task)
+                    continue
+                outstanding += task.pending
+                for future in task.futures:
+                    future.add_done_callback(lambda f, t=task: events.put(('asset', t)))
+            elif kind == 'asset':
+                task.pending -= 1
+                if task.pending == 0:
+                    finish(task)
+            elif kind == 'saved':
+                active_pages -= 1
+
+    def start(self):
+        requests.packages.urllib3.disable_warnings()
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                self.executor = executor
+                self.run_scheduler()
+            self.completed = not self.limits.cut_short and not self.control.cancelled
+        finally:
+            self.log(self.http.summary(), "info")
+            self.http.close()
+            self.close_task_resources()
+
+# ================= 异步下载引擎 =================
+
+class AsyncCoreDownloader(CoreDownloader):
+    """基于 asyncio + aiohttp 的异步下载引擎
+
+    参数与 CoreDownloader 相同。所有网络请求运行在同一个事件循环上，
+    通过全局信号量和 HostController 的按主机名额控制并发；HTML 解析、后处理和
+    Pillow 图片转换等 CPU 密集工作交给线程池执行。
+    """
+    ENGINE = 'async'
+
+    def __init__(self, params, sink=None):
+        if aiohttp is None:
+            raise RuntimeError("异步引擎需要 aiohttp，请先执行: pip install aiohttp")
+        super().__init__(params, sink)
+        self.global_limit = params.get('async_limit', 1000)
+        if not params.get('budget'):
+            self.budget = TransferBudget(self.global_limit)
+        self.loop = None
+        self.session = None
+        self._global_sem = None
+        self._asset_tasks = {}
+        self.fetch_count = 0
+
+    async def run_cpu(self, func, *args):
+        """在线程池中执行 CPU 密集任务，避免阻塞事件循环"""
+        return await self.loop.run_in_executor(self.executor, self.metrics.queued(func), *args)
+
+    async def fetch_resource(self, url, sub_folder):
+        # 续传时已下载的资源直接复用
+        result = self.url_results.get((url, sub_folder))
+        if result is None:
+            result = await self.fetch_with_retry(url, sub_folder)
+            if sub_folder == 'css' and result:
+                result = await self.process_stylesheet_async(url, result)
+        self.resource_done(url, result)
+        return result
+
+    async def process_stylesheet_async(self, url, rel_path):
+        """与 process_stylesheet 相同，引用的资源作为协程并发下载"""
+        result = self.loop.create_future()
+        claimed = self.stylesheets.claim(url, rel_path, result)
+        if claimed is not result: return await claimed
+        resolved = {}
+        try:
+            text, refs = await self.run_cpu(self.stylesheet_refs, url, rel_path)
+            children = self.stylesheet_children(url, refs, resolved)
+            paths = await asyncio.gather(*(self.submit_resource(abs_url, folder) for _, abs_url, folder in children))
+            resolved.update((raw, path) for (raw, _, _), path in zip(children, paths) if path)
+            await self.run_cpu(self.save_stylesheet, rel_path, text, resolved)
+            self.stylesheet_done(url, rel_path)
+        except Exception as e:
+            self.log(f"   ⚠️ 样式表处理失败: {e}", "warning")
+        result.set_result(rel_path)
+        return rel_path
+
+    async def fetch_with_retry(self, url, sub_folder):
+        waiting = self.retry.begin(url)
+        while waiting:
+            await self.loop.run_in_executor(None, waiting.wait)
+            waiting = self.retry.begin(url)
+        try:
+            if not await self.control.wait_async(): return None
+            plan = self.plan_fetch(url, sub_folder)
+            if plan is None: return None
+            for attempt in range(self.retry.attempts):
+                try:
+                    result = await self._fetch_resource(url, sub_folder, plan)
+                    if attempt: self.retry.record_recovered()
+                    return result
+                except Exception as e:
+                    delay = self.retry_delay(url, attempt, e)
+                    if delay is None: return None
+                    await asyncio.sleep(delay)
+        finally:
+            self.retry.end(url)
+
+    async def _fetch_resource(self, url, sub_folder, plan):
+        """异步下载单个资源（一次尝试），响应体按块直接写入对象库的临时文件"""
+        target = None
+        try:
+            filename, kind = plan
+            target = self.store.temp_path()
+            hasher = hashlib.sha256()
+            ranged = False
+            async with self.hosts.async_slot(url) as slot, self._global_sem, self.budget.async_connection():
+                await self.control.check_async()
+                self.log(f"   ⬇️ {filename}", "file")
+                self.fetch_count += 1
+                t0 = time.perf_counter()
+                async with self.session.get(url, headers=self.request_headers(url)) as resp:
+                    latency = time.perf_counter() - t0
+                    slot.done(resp.status, resp.headers, latency)
+                    if resp.status == 304 and self.cache:
+                        result = await self.run_cpu(self.reuse_cached, url, sub_folder, kind == 'img')
+                        if isinstance(result, concurrent.futures.Future):
+                            result = await asyncio.wrap_future(result)
+                        return result
+                    if resp.status != 200:
+                        raise self.retry.http_error(resp.status, resp.headers)
+                    headers = resp.headers
+                    content_type = headers.get('Content-Type')
+                    accepted, kind = self.accept_response(url, sub_folder, plan, headers)
+                    if not accepted: return None
+                    convert = self.should_convert(url, kind == 'img', content_type)
+                    ranged = self.use_ranges(url, headers, kind)
+                    if not ranged:
+                        t0 = time.perf_counter()
+                        with open(target, 'wb') as f:
+                            async for chunk in resp.content.iter_chunked(65536):
+                                f.write(chunk)
+                                hasher.update(chunk)
+                                await self.transfer_async(len(chunk), f.tell())
+                            self.metrics.fetch(url, latency, f.tell(), time.perf_counter() - t0)
+                        self.check_length(headers, target)
+                        digest = hasher.hexdigest()
+
+            if ranged:
+                # 分段下载复用线程引擎的实现，在线程池中运行
+                remove_quietly(target)
+                target, digest = await self.run_cpu(self.download_ranged, url, headers, filename)
+            if self.cache: self.cache.store(url, headers, src_path=target)
+
+            if convert:
+                src_path, target = target, None
+                return await asyncio.wrap_future(self.convert_image(src_path, url, sub_folder, content_type))
+            relative_path = await self.run_cpu(self.place_file, target, url, sub_folder, content_type, digest)
+            target = None
+            return relative_path
+        finally:
+            if target: remove_quietly(target)
+
+    def submit_resource(self, url, sub_folder):
+        """同一任务内相同资源只创建一个下载协程"""
+        key = (url, sub_folder)
+        task = self._asset_tasks.get(key)
+        if task is None:
+            task = self._asset_tasks[key] = asyncio.ensure_future(self.fetch_resource(url, sub_folder))
+        return task
+
+    async def process_page_async(self, url, depth):
+        task = PageTask(url, depth)
+        async with self._page_sem:
+            if not await self.control.wait_async(): return task
+            if self.limits.exhausted:
+                self.limits.drop_pages(1)
+                return task
+            self.log(f"🌍 分析页面 [深度{depth}]: {url}", "info")
+            try:
+                async with self.hosts.async_slot(url) as slot, self._global_sem, self.budget.async_connection():
+                    await self.control.check_async()
+                    self.fetch_count += 1
+                    t0 = time.perf_counter()
+                    async with self.session.get(url, headers=self.request_headers(url, page=True)) as resp:
+                        latency = time.perf_counter() - t0
+                        slot.done(resp.status, resp.headers, latency)
+                        if not self.urls.redirected(url, str(resp.url)):
+                            self.log(f"   ↪️ 跳转到已抓取的页面，跳过: {resp.url}", "info")
+                            return task
+                        if resp.status == 304 and self.cache:
+                            if not self.accept_cached_page(url): return task
+                            body, content_type = self.cache.read(url)
+                            if body is None: return task
+                        elif resp.status == 200:
+                            if not self.accept_page(url, resp.headers): return task
+                            chunks, received = [], 0
+                            async for chunk in resp.content.iter_chunked(65536):
+                                chunks.append(chunk)
+                                received += len(chunk)
+                                await self.transfer_async(len(chunk), received)
+                            body = b''.join(chunks)
+                            task.fetch_ms = (time.perf_counter() - t0) * 1000
+                            self.metrics.fetch(url, latency, len(body), task.fetch_ms / 1000 - latency, 'page')
+                            content_type = resp.headers.get('Content-Type')
+                            if self.cache: self.cache.store(url, resp.headers, data=body)
+                        else:
+                            return task
+
+                await self.run_cpu(self.parse_page, task, body, content_type)
+                rel_paths = await asyncio.gather(
+                    *(self.submit_resource(abs_url, folder) for abs_url, folder in task.refs))
+                if task.doc is not None:
+                    await self.run_cpu(self.save_page, task, rel_paths)
+            except TaskCancelled:
+                pass
+            except BudgetExceeded as e:
+                self.skip_page(url, e)
+            except Exception as e:
+                self.report_page_error(e)
+        return task
+
+    async def transfer_async(self, nbytes, received=None):
+        await self.control.check_async()
+        await self.budget.throttle_async(nbytes)
+        self.limits.add_bytes(nbytes)
+        self.limits.check(received)
+
+    async def run_async(self):
+        self.loop = asyncio.get_running_loop()
+        self._global_sem = asyncio.Semaphore(self.global_limit)
+        self._page_sem = asyncio.Semaphore(self.max_workers)
+        connector = aiohttp.TCPConnector(limit=self.global_limit, ssl=False)
+        timeout = aiohttp.ClientTimeout(sock_connect=10, sock_read=10)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         trace_configs=[self.trace_config()]) as session:
+            self.session = session
+            pending = {asyncio.ensure_future(self.process_page_async(url, depth))
+                       for url, depth in self.restore_journal()}
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=self.control.CHECK_INTERVAL,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if self.control.cancelled:
+                    await self.cancel_tasks(pending)
+                    return
+                for finished in done:
+                    task = finished.result()
+                    for link in task.links:
+                        next_url = self.queue_page(link, task.depth + 1)
+                        if next_url:
+                            pending.add(asyncio.ensure_future(self.process_page_async(next_url, task.depth + 1)))
+
+    def trace_config(self):
+        """用 aiohttp 的请求跟踪记录 DNS 解析和建立连接（含 TLS 握手）的耗时"""
+        trace = aiohttp.TraceConfig()
+
+        def timed(name):
+            async def start(session, ctx, params):
+                setattr(ctx, name, time.perf_counter())
+
+            async def end(session, ctx, params):
+                self.metrics.phase(name, time.perf_counter() - getattr(ctx, name))
+            return start, end
+
+        for name, signals in (('dns', (trace.on_dns_resolvehost_start, trace.on_dns_resolvehost_end)),
+                              ('connect', (trace.on_connection_create_start, trace.on_connection_create_end))):
+            for signal, callback in zip(signals, timed(name)):
+                signal.append(callback)
+        return trace
+
+    async def cancel_tasks(self, pages):
+        """停止：取消所有页面和资源协程，正在传输的响应随之关闭"""
+        tasks = list(pages) + [t for t in self._asset_tasks.values() if not t.done()]
+        for task in tasks: task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.log(f"⏹️ 任务已停止，{len(pages)} 个未完成的页面保留在抓取日志中", "warning")
+
+    def start(self):
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                self.executor = executor
+                asyncio.run(self.run_async())
+            self.completed = not self.limits.cut_short and not self.control.cancelled
+        finally:
+            self.log(f"⚡ 异步引擎: 共发起 {self.fetch_count} 次请求, 涉及 {len(self.hosts.hosts)} 个主机", "info")
+            self.http.close()
+            self.close_task_resources()
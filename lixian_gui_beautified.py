@@ -1,19 +1,16 @@
 import os
-import re
 import time
 import threading
 import platform
 import subprocess
 import tkinter as tk
 from tkinter import ttk, filedialog, scrolledtext, messagebox
-from urllib.parse import urljoin, urlparse, unquote
-from io import BytesIO
-import requests
-from bs4 import BeautifulSoup
-from fake_useragent import UserAgent
-from PIL import Image
-import concurrent.futures
+import queue
 import traceback
+import multiprocessing
+from collections import deque
+
+from lixian_core import DownloadSink, TransferBudget, TaskControl, create_downloader, open_task_dir, aiohttp
 
 class ErrorDialog:
     """可复制错误的弹窗对话框"""
@@ -109,11 +106,40 @@ class ErrorDialog:
         y = (self.window.winfo_screenheight() // 2) - (height // 2)
         self.window.geometry(f'{width}x{height}+{x}+{y}')
 
+class GuiSink(DownloadSink):
+    """把下载引擎的事件转交给图形界面，多个任务同时运行时日志前加上任务编号"""
+    def __init__(self, gui, label=""):
+        self.gui = gui
+        self.prefix = f"[{label}] " if label else ""
+
+    def log(self, msg, tag="info"):
+        # gui.log 只是把消息放进线程安全队列，由界面线程定时批量刷新
+        self.gui.log(self.prefix + msg, tag)
+
+    def error(self, title, message, details):
+        self.gui.root.after(0, lambda: ErrorDialog(self.gui.root, title, message, details))
+
+class QueuedTask:
+    """任务队列中的一个网址，每个任务有自己的任务目录"""
+    def __init__(self, index, url):
+        self.index = index
+        self.url = url
+        self.task_dir = ""
+        self.resumed = False
+        self.status = "等待中"
+        self.downloader = None
+        self.row = None
+
 class WebDownloaderGUI:
+    LOG_INTERVAL_MS = 100      # 日志区刷新间隔
+    LOG_BATCH_LIMIT = 2000     # 每次刷新最多处理的日志条数
+    LOG_MAX_LINES = 5000       # 日志区最多保留的行数（环形缓冲）
+    FILE_LINES_PER_TICK = 20   # 一次刷新内逐文件日志超过该数量时合并为汇总行
+
     def __init__(self, root):
         self.root = root
         self.root.title("🌐 网页资源离线下载器 - 专业美化版")
-        self.root.geometry("800x700")
+        self.root.geometry("800x860")
         self.root.configure(bg='#f5f5f5')
         
         # 设置图标
@@ -125,7 +151,6 @@ class WebDownloaderGUI:
                 print(f"无法加载图标: {e}")
         
         # --- 变量绑定 ---
-        self.url_var = tk.StringVar()
         default_dir = os.path.join(os.getcwd(), "downloads")
         self.save_dir_var = tk.StringVar(value=default_dir)
         
@@ -133,18 +158,44 @@ class WebDownloaderGUI:
         self.mode_var = tk.StringVar(value="full")
         self.convert_img_var = tk.BooleanVar(value=False)
         self.target_fmt_var = tk.StringVar(value="PNG")
+        self.img_quality_var = tk.IntVar(value=85)
+        self.img_max_dim_var = tk.IntVar(value=0)
+        self.img_keep_smaller_var = tk.BooleanVar(value=True)
         self.filter_video_var = tk.BooleanVar(value=True)
         self.filter_img_var = tk.BooleanVar(value=True)
         self.auto_open_var = tk.BooleanVar(value=True)
+        self.resume_var = tk.BooleanVar(value=True)
         self.path_mode_var = tk.StringVar(value="absolute")
+        self.workers_var = tk.IntVar(value=6)
+        self.jobs_var = tk.IntVar(value=2)
+        self.rate_var = tk.IntVar(value=0)
+        self.max_pages_var = tk.IntVar(value=0)
+        self.max_mb_var = tk.IntVar(value=0)
+        self.max_file_mb_var = tk.IntVar(value=0)
+        self.time_limit_var = tk.IntVar(value=0)
+        self.engine_var = tk.StringVar(value="thread")
+        self.parser_var = tk.StringVar(value="lxml")
+        self.cache_var = tk.BooleanVar(value=True)
         
         self.is_running = False
         self.current_task_dir = ""
+        self.log_queue = queue.Queue()
+        self.files_logged = 0
+
+        # 任务队列：所有任务共享同一个连接数/带宽预算
+        self.tasks = []
+        self.pending_tasks = deque()
+        self.active_tasks = []
+        self.finished_tasks = 0
+        self.failed_tasks = 0
+        self.budget = None
+        self.control = None
 
         self.setup_styles()
         self.create_widgets()
         self.update_path_display()
         self.update_depth_value()
+        self.root.after(self.LOG_INTERVAL_MS, self.drain_log)
 
     def setup_styles(self):
         """设置现代化样式"""
@@ -186,6 +237,9 @@ class WebDownloaderGUI:
         # 操作区域
         self.create_action_section(main_container)
         
+        # 任务队列
+        self.create_task_section(main_container)
+        
         # 日志区域
         self.create_log_section(main_container)
         
@@ -237,10 +291,10 @@ class WebDownloaderGUI:
         url_row = ttk.Frame(parent)
         url_row.pack(fill="x", pady=5)
         
-        ttk.Label(url_row, text="目标网址:", style="Bold.TLabel").pack(side="left")
-        url_entry = ttk.Entry(url_row, textvariable=self.url_var, width=60, font=("Microsoft YaHei", 9))
-        url_entry.pack(side="left", padx=10)
-        ttk.Label(url_row, text="(例如: https://example.com)", foreground="#95a5a6").pack(side="left")
+        ttk.Label(url_row, text="目标网址:", style="Bold.TLabel").pack(side="left", anchor="n")
+        self.url_text = tk.Text(url_row, width=60, height=3, font=("Microsoft YaHei", 9), relief="solid", borderwidth=1)
+        self.url_text.pack(side="left", padx=10)
+        ttk.Label(url_row, text="(每行一个，可粘贴多个\n例如: https://example.com)", foreground="#95a5a6").pack(side="left", anchor="n")
         
         # 保存路径行
         path_row = ttk.Frame(parent)
@@ -323,6 +377,68 @@ class WebDownloaderGUI:
                                             state="disabled")
         self.custom_depth_spin.pack(side="left", padx=5)
         self.custom_depth_spin.bind('<KeyRelease>', lambda e: self.depth_var.set(self.custom_depth_var.get()))
+        
+        # 全局并发设置
+        workers_frame = ttk.Frame(parent)
+        workers_frame.pack(fill="x", pady=8)
+        
+        ttk.Label(workers_frame, text="并发连接:", style="Bold.TLabel").pack(side="left")
+        ttk.Spinbox(workers_frame, from_=1, to=64, 
+                   textvariable=self.workers_var, 
+                   width=4).pack(side="left", padx=15)
+        ttk.Label(workers_frame, text="并发任务:", style="Bold.TLabel").pack(side="left")
+        ttk.Spinbox(workers_frame, from_=1, to=16, 
+                   textvariable=self.jobs_var, 
+                   width=3).pack(side="left", padx=15)
+        ttk.Label(workers_frame, text="限速 KB/s:", style="Bold.TLabel").pack(side="left")
+        ttk.Spinbox(workers_frame, from_=0, to=1000000, increment=100, 
+                   textvariable=self.rate_var, 
+                   width=7).pack(side="left", padx=15)
+        ttk.Label(workers_frame, 
+                  text="(所有任务共享，0 = 不限)",
+                  foreground="#95a5a6").pack(side="left")
+        
+        # 抓取上限（每个任务单独计算）
+        limits_frame = ttk.Frame(parent)
+        limits_frame.pack(fill="x", pady=8)
+        
+        ttk.Label(limits_frame, text="抓取上限:", style="Bold.TLabel").pack(side="left")
+        for text, var, top, step in (("页面", self.max_pages_var, 100000, 10),
+                                     ("总流量 MB", self.max_mb_var, 1000000, 100),
+                                     ("单文件 MB", self.max_file_mb_var, 100000, 10),
+                                     ("时限(分钟)", self.time_limit_var, 10000, 5)):
+            ttk.Label(limits_frame, text=text).pack(side="left", padx=(15, 5))
+            ttk.Spinbox(limits_frame, from_=0, to=top, increment=step, 
+                       textvariable=var, 
+                       width=6).pack(side="left")
+        ttk.Label(limits_frame, 
+                  text="(0 = 不限)",
+                  foreground="#95a5a6").pack(side="left", padx=15)
+        
+        # 下载引擎选择
+        engine_frame = ttk.Frame(parent)
+        engine_frame.pack(fill="x", pady=8)
+        
+        ttk.Label(engine_frame, text="下载引擎:", style="Bold.TLabel").pack(side="left")
+        
+        engine_options = ttk.Frame(engine_frame)
+        engine_options.pack(side="left", padx=15)
+        
+        ttk.Radiobutton(engine_options, text="🧵 线程池", 
+                       variable=self.engine_var, value="thread").pack(side="left", padx=10)
+        async_rb = ttk.Radiobutton(engine_options, text="⚡ 异步 (aiohttp)", 
+                                  variable=self.engine_var, value="async")
+        async_rb.pack(side="left")
+        if aiohttp is None:
+            async_rb.config(state="disabled")
+            ttk.Label(engine_frame, text="(未安装 aiohttp)", foreground="#95a5a6").pack(side="left", padx=10)
+        
+        ttk.Label(engine_frame, text="解析器:", style="Bold.TLabel").pack(side="left", padx=(20, 0))
+        ttk.Combobox(engine_frame, 
+                    textvariable=self.parser_var, 
+                    values=["lxml", "bs4"], 
+                    width=6, state="readonly").pack(side="left", padx=5)
+        ttk.Label(engine_frame, text="(bs4 = BeautifulSoup 兼容模式)", foreground="#95a5a6").pack(side="left")
 
     def create_resource_config(self, parent):
         """资源控制配置"""
@@ -354,9 +470,39 @@ class WebDownloaderGUI:
         
         format_combo = ttk.Combobox(convert_options, 
                                    textvariable=self.target_fmt_var, 
-                                   values=["PNG", "JPG"], 
+                                   values=["PNG", "JPG", "WEBP"], 
                                    width=6, state="readonly")
         format_combo.pack(side="left", padx=5)
+        
+        ttk.Label(convert_options, text="质量:").pack(side="left", padx=(15, 0))
+        ttk.Spinbox(convert_options, from_=1, to=100, 
+                   textvariable=self.img_quality_var, 
+                   width=4).pack(side="left", padx=5)
+        
+        # 图片优化设置
+        optimize_frame = ttk.Frame(parent)
+        optimize_frame.pack(fill="x", pady=8)
+        
+        ttk.Label(optimize_frame, text="图片优化:", style="Bold.TLabel").pack(side="left")
+        
+        optimize_options = ttk.Frame(optimize_frame)
+        optimize_options.pack(side="left", padx=15)
+        
+        ttk.Label(optimize_options, text="最大边长:").pack(side="left")
+        ttk.Spinbox(optimize_options, from_=0, to=10000, increment=100, 
+                   textvariable=self.img_max_dim_var, 
+                   width=6).pack(side="left", padx=5)
+        ttk.Label(optimize_options, text="(0 = 不缩放)", foreground="#95a5a6").pack(side="left")
+        ttk.Checkbutton(optimize_options, text="变大时保留原图", 
+                       variable=self.img_keep_smaller_var).pack(side="left", padx=15)
+        
+        # 跨任务缓存
+        cache_frame = ttk.Frame(parent)
+        cache_frame.pack(fill="x", pady=8)
+        
+        ttk.Label(cache_frame, text="缓存策略:", style="Bold.TLabel").pack(side="left")
+        ttk.Checkbutton(cache_frame, text="🗄️ 跨任务缓存 (未变化的资源直接复用)", 
+                       variable=self.cache_var).pack(side="left", padx=15)
 
     def create_action_section(self, parent):
         """创建操作区域"""
@@ -373,6 +519,8 @@ class WebDownloaderGUI:
         
         ttk.Checkbutton(options_frame, text="📂 下载后自动打开文件夹", 
                        variable=self.auto_open_var).pack(side="left")
+        ttk.Checkbutton(options_frame, text="♻️ 继续未完成的任务", 
+                       variable=self.resume_var).pack(side="left", padx=(10, 0))
         
         # 右侧按钮
         buttons_frame = ttk.Frame(action_row)
@@ -384,10 +532,41 @@ class WebDownloaderGUI:
                                    style="Success.TButton")
         self.btn_start.pack(side="left", padx=5)
         
+        # 暂停/停止作用于当前这一批的全部任务
+        self.btn_pause = ttk.Button(buttons_frame, 
+                                   text="⏸️ 暂停", 
+                                   command=self.toggle_pause,
+                                   state="disabled")
+        self.btn_pause.pack(side="left", padx=(0, 5))
+        
+        self.btn_stop = ttk.Button(buttons_frame, 
+                                  text="⏹️ 停止", 
+                                  command=self.stop_tasks,
+                                  state="disabled")
+        self.btn_stop.pack(side="left", padx=(0, 5))
+        
+        ttk.Button(buttons_frame, 
+                  text="🧹 清除已完成", 
+                  command=self.clear_finished_tasks).pack(side="left", padx=(0, 5))
+        
         ttk.Button(buttons_frame, 
                   text="🗑️ 清空日志", 
                   command=self.clear_log).pack(side="left")
 
+    def create_task_section(self, parent):
+        """创建任务队列区域"""
+        task_card = ttk.LabelFrame(parent, text=" 📋 任务队列 ", padding=10)
+        task_card.pack(fill="x", pady=(0, 5))
+        
+        columns = ("url", "status", "pages", "files", "dir")
+        self.task_tree = ttk.Treeview(task_card, columns=columns, show="headings", height=4)
+        for column, title, width in (("url", "网址", 300), ("status", "状态", 70),
+                                     ("pages", "页面", 50), ("files", "资源", 50),
+                                     ("dir", "任务目录", 220)):
+            self.task_tree.heading(column, text=title)
+            self.task_tree.column(column, width=width, anchor="w" if column in ("url", "dir") else "center")
+        self.task_tree.pack(fill="x")
+
     def create_log_section(self, parent):
         """创建日志区域"""
         log_card = ttk.LabelFrame(parent, text=" 📝 下载日志 ", padding=10)
@@ -395,7 +574,7 @@ class WebDownloaderGUI:
         
         # 日志区域
         self.log_area = scrolledtext.ScrolledText(log_card, 
-                                                 height=15, 
+                                                 height=10, 
                                                  state='disabled', 
                                                  font=("Consolas", 9), 
                                                  bg="#f8f9fa",
@@ -407,6 +586,7 @@ class WebDownloaderGUI:
         self.log_area.tag_config("error", foreground="#e74c3c")
         self.log_area.tag_config("warning", foreground="#f39c12")
         self.log_area.tag_config("info", foreground="#3498db")
+        self.log_area.tag_config("file", foreground="#3498db")
 
     def create_status_bar(self, parent):
         """创建状态栏"""
@@ -498,19 +678,61 @@ class WebDownloaderGUI:
 
     def clear_log(self):
         """清空日志"""
+        while True:
+            try:
+                self.log_queue.get_nowait()
+            except queue.Empty:
+                break
         self.log_area.config(state='normal')
         self.log_area.delete(1.0, tk.END)
         self.log_area.config(state='disabled')
         self.log("📝 日志已清空", "info")
 
     def log(self, msg, tag=None):
-        """添加日志"""
+        """添加日志（线程安全，只入队，由 drain_log 批量写入日志区）"""
+        self.log_queue.put((time.strftime("%H:%M:%S"), msg, tag))
+
+    def drain_log(self):
+        """定时把队列中的日志批量写入日志区"""
+        try:
+            items = []
+            while len(items) < self.LOG_BATCH_LIMIT:
+                try:
+                    items.append(self.log_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if items:
+                self.write_log_batch(items)
+            for task in self.active_tasks:
+                self.refresh_task_row(task)
+        finally:
+            self.root.after(self.LOG_INTERVAL_MS, self.drain_log)
+
+    def write_log_batch(self, items):
+        """一次性写入一批日志：逐文件日志过多时合并为一行汇总，并限制总行数"""
+        file_items = [item for item in items if item[2] == "file"]
+        self.files_logged += len(file_items)
+        if len(file_items) > self.FILE_LINES_PER_TICK:
+            timestamp, last_msg, _ = file_items[-1]
+            latest = last_msg.replace("⬇️", "").strip()
+            items = [item for item in items if item[2] != "file"]
+            items.append((timestamp, f"   ⬇️ 下载 {len(file_items)} 个文件 (最近: {latest}), 累计 {self.files_logged} 个", "file"))
+
+        args = []
+        for timestamp, msg, tag in items:
+            args.extend((f"[{timestamp}] {msg}\n", tag or ()))
+
         self.log_area.config(state='normal')
-        timestamp = time.strftime("%H:%M:%S")
-        self.log_area.insert(tk.END, f"[{timestamp}] {msg}\n", tag)
+        self.log_area.insert(tk.END, *args)
+        lines = int(self.log_area.index('end-1c').split('.')[0])
+        if lines > self.LOG_MAX_LINES:
+            self.log_area.delete('1.0', f"{lines - self.LOG_MAX_LINES + 1}.0")
         self.log_area.see(tk.END)
         self.log_area.config(state='disabled')
 
+        if self.is_running and file_items:
+            self.update_status()
+
     def open_file_explorer(self, path):
         """跨平台打开文件夹"""
         try:
@@ -524,310 +746,243 @@ class WebDownloaderGUI:
         except Exception as e:
             self.log(f"⚠️ 无法自动打开目录: {e}", "warning")
 
+    def read_urls(self):
+        """读取网址输入框，每行一个网址，自动补全协议并去重"""
+        urls = []
+        for url in self.url_text.get("1.0", tk.END).split():
+            if not url.startswith(('http://', 'https://')):
+                url = 'https://' + url
+            if url not in urls:
+                urls.append(url)
+        return urls
+
     def start_thread(self):
-        """启动下载线程"""
-        if self.is_running:
-            messagebox.showwarning("提示", "当前有任务正在运行中！")
-            return
-        
-        url = self.url_var.get().strip()
-        if not url:
+        """把输入的网址加入任务队列，并在并发任务数上限内启动"""
+        urls = self.read_urls()
+        if not urls:
             messagebox.showwarning("提示", "请输入有效的网址！")
             return
+        if self.is_running and self.control.cancelled:
+            messagebox.showwarning("提示", "正在停止当前任务，请稍候再开始下载。")
+            return
         
-        # 验证网址格式
-        if not url.startswith(('http://', 'https://')):
-            url = 'https://' + url
-            self.url_var.set(url)
-        
-        # 创建任务目录
-        domain_name = urlparse(url).netloc.replace("www.", "")
-        timestamp = time.strftime("%Y%m%d_%H%M%S")
-        safe_name = f"{domain_name}_{timestamp}"
-        self.current_task_dir = os.path.join(self.get_absolute_path(), safe_name)
+        if not self.is_running:
+            # 新的一批任务：清空日志、计数，并按当前设置创建共享预算
+            self.clear_log()
+            self.files_logged = 0
+            self.finished_tasks = 0
+            self.failed_tasks = 0
+            # 与命令行版一致：线程引擎按并发连接数共享预算，异步引擎每个任务另有自己的并发上限
+            connections = (max(1, self.workers_var.get()) if self.engine_var.get() == "thread"
+                           else 1000 * max(1, self.jobs_var.get()))
+            self.budget = TransferBudget(connections, max(0, self.rate_var.get()) * 1024)
+            self.control = TaskControl()
+        
+        for url in urls:
+            task = QueuedTask(len(self.tasks) + 1, url)
+            task.row = self.task_tree.insert("", tk.END, values=self.task_row(task))
+            self.tasks.append(task)
+            self.pending_tasks.append(task)
+        self.url_text.delete("1.0", tk.END)
         
         self.is_running = True
-        self.btn_start.config(state="disabled", text="⏳ 下载中...")
-        self.clear_log()
-        self.status_var.set("🟡 正在下载中...")
-        
-        threading.Thread(target=self.run_logic, daemon=True).start()
+        self.btn_start.config(text="➕ 加入队列")
+        self.btn_pause.config(state="normal")
+        self.btn_stop.config(state="normal")
+        self.pump_tasks()
+
+    def toggle_pause(self):
+        """暂停或继续当前这一批任务；暂停时排队中的任务也不会开始传输"""
+        if not self.is_running: return
+        if self.control.paused:
+            self.control.resume()
+            self.btn_pause.config(text="⏸️ 暂停")
+            self.log("▶️ 继续下载", "info")
+        else:
+            self.control.pause()
+            self.btn_pause.config(text="▶️ 继续")
+            self.log("⏸️ 已暂停，正在传输的文件停在当前位置", "warning")
+        self.update_status()
+
+    def stop_tasks(self):
+        """停止当前这一批任务：取消排队中的任务，运行中的任务保留断点后结束"""
+        if not self.is_running: return
+        self.control.cancel()
+        while self.pending_tasks:
+            task = self.pending_tasks.popleft()
+            task.status = "已取消"
+            self.finished_tasks += 1
+            self.refresh_task_row(task)
+        self.btn_pause.config(state="disabled", text="⏸️ 暂停")
+        self.btn_stop.config(state="disabled")
+        self.log("⏹️ 正在停止，未完成的任务下次可以继续", "warning")
+        self.status_var.set(f"🟠 正在停止 {len(self.active_tasks)} 个任务...")
+        if not self.active_tasks:
+            self.on_finish_success()
+
+    def pump_tasks(self):
+        """启动排队中的任务，直到达到并发任务数上限"""
+        while self.pending_tasks and len(self.active_tasks) < max(1, self.jobs_var.get()):
+            task = self.pending_tasks.popleft()
+            try:
+                running = {t.task_dir for t in self.active_tasks}
+                task.task_dir, task.resumed = open_task_dir(self.get_absolute_path(), task.url,
+                                                            self.resume_var.get(), running)
+            except OSError as e:
+                self.log(f"❌ 无法创建任务目录: {e}", "error")
+                task.status = "失败"
+                self.finished_tasks += 1
+                self.failed_tasks += 1
+                self.refresh_task_row(task)
+                continue
+            
+            self.current_task_dir = task.task_dir
+            task.status = "下载中"
+            self.active_tasks.append(task)
+            self.refresh_task_row(task)
+            
+            # 在界面线程中读取设置，工作线程不访问 Tk 变量
+            label = str(task.index) if len(self.tasks) > 1 else ""
+            params = self.build_params(task)
+            engine = self.engine_var.get()
+            threading.Thread(target=self.run_logic, args=(task, params, engine, label), daemon=True).start()
+        self.update_status()
+
+    def build_params(self, task):
+        """根据当前界面设置生成下载参数"""
+        return {
+            'url': task.url,
+            'output_dir': task.task_dir,
+            'depth': self.depth_var.get(),
+            'mode': self.mode_var.get(),
+            'filter_img': self.filter_img_var.get(),
+            'filter_video': self.filter_video_var.get(),
+            'convert_img': self.convert_img_var.get(),
+            'target_fmt': self.target_fmt_var.get(),
+            'img_quality': max(1, min(100, self.img_quality_var.get())),
+            'img_max_dim': max(0, self.img_max_dim_var.get()),
+            'img_keep_smaller': self.img_keep_smaller_var.get(),
+            'max_workers': max(1, self.workers_var.get()),
+            'cache_dir': os.path.join(self.get_absolute_path(), ".http_cache") if self.cache_var.get() else None,
+            'store_dir': os.path.join(self.get_absolute_path(), ".asset_store"),
+            'parser': self.parser_var.get(),
+            'max_pages': max(0, self.max_pages_var.get()),
+            'max_bytes': max(0, self.max_mb_var.get()) * 1024 * 1024,
+            'max_file_size': max(0, self.max_file_mb_var.get()) * 1024 * 1024,
+            'time_limit': max(0, self.time_limit_var.get()) * 60,
+            'budget': self.budget,
+            'control': self.control
+        }
 
-    def run_logic(self):
-        """运行下载逻辑"""
+    def run_logic(self, task, params, engine, label):
+        """运行单个任务的下载逻辑（工作线程）"""
+        sink = GuiSink(self, label)
         try:
-            depth_mode = self.depth_mode_var.get()
-            depth_value = self.depth_var.get()
-            
+            depth_value = params['depth']
             depth_description = {
-                "page_only": "仅本页",
-                "page_next": "本页+下页",
-                "page_next2": "本页+下2页",
-                "custom": f"自定义({depth_value}层)"
-            }.get(depth_mode, f"深度{depth_value}")
-            
-            params = {
-                'url': self.url_var.get(),
-                'output_dir': self.current_task_dir,
-                'depth': self.depth_var.get(),
-                'mode': self.mode_var.get(),
-                'filter_img': self.filter_img_var.get(),
-                'filter_video': self.filter_video_var.get(),
-                'convert_img': self.convert_img_var.get(),
-                'target_fmt': self.target_fmt_var.get()
-            }
+                0: "仅本页",
+                1: "本页+下页",
+                2: "本页+下2页"
+            }.get(depth_value, f"自定义({depth_value}层)")
             
-            self.root.after(0, lambda: self.log(f"📂 创建任务目录: {self.current_task_dir}", "info"))
-            self.root.after(0, lambda: self.log(f"📊 爬取深度: {depth_description}", "info"))
-            downloader = CoreDownloader(self, params)
-            downloader.start()
+            if task.resumed:
+                sink.log(f"♻️ 继续未完成的任务目录: {task.task_dir}", "info")
+            else:
+                sink.log(f"📂 创建任务目录: {task.task_dir}", "info")
+            sink.log(f"📊 爬取深度: {depth_description}", "info")
+            sink.log(f"🧵 并发连接: {params['max_workers']}", "info")
+            if engine == "async":
+                sink.log("⚡ 使用异步下载引擎", "info")
+            task.downloader = create_downloader(params, sink, engine)
+            task.downloader.start()
             
-            self.root.after(0, self.on_finish_success)
+            self.root.after(0, lambda: self.on_task_finished(task, True))
             
         except Exception as e:
             error_msg = f"下载过程中发生错误: {str(e)}"
             error_details = traceback.format_exc()
             
             # 在日志中显示错误
-            self.root.after(0, lambda: self.log(f"❌ 发生错误: {str(e)}", "error"))
-            self.root.after(0, lambda: self.status_var.set("🔴 下载失败"))
+            sink.log(f"❌ 发生错误: {str(e)}", "error")
             
             # 弹出错误对话框
             self.root.after(0, lambda: ErrorDialog(self.root, "下载错误", error_msg, error_details))
-        finally:
-            self.is_running = False
-            self.root.after(0, lambda: self.btn_start.config(state="normal", text="🚀 开始下载"))
+            self.root.after(0, lambda: self.on_task_finished(task, False))
+
+    def task_row(self, task):
+        downloader = task.downloader
+        return (task.url, task.status,
+                downloader.pages_saved if downloader else "",
+                downloader.files_saved if downloader else "",
+                os.path.basename(task.task_dir))
+
+    def refresh_task_row(self, task):
+        if self.task_tree.exists(task.row):
+            self.task_tree.item(task.row, values=self.task_row(task))
+
+    def clear_finished_tasks(self):
+        """从任务列表中移除已结束的任务"""
+        for task in [t for t in self.tasks if t.status in ("完成", "失败", "已停止", "已取消")]:
+            if self.task_tree.exists(task.row):
+                self.task_tree.delete(task.row)
+
+    def update_status(self):
+        if self.is_running and self.control.cancelled:
+            return
+        if self.is_running and self.control.paused:
+            self.status_var.set(f"⏸️ 已暂停 - 运行 {len(self.active_tasks)} 个任务, "
+                                f"排队 {len(self.pending_tasks)} 个, 已处理 {self.files_logged} 个文件")
+        elif self.is_running:
+            self.status_var.set(f"🟡 正在下载中... 运行 {len(self.active_tasks)} 个任务, "
+                                f"排队 {len(self.pending_tasks)} 个, 已结束 {self.finished_tasks} 个, "
+                                f"已处理 {self.files_logged} 个文件")
+
+    def on_task_finished(self, task, success):
+        """单个任务结束：更新任务行并启动下一个排队任务"""
+        if not success:
+            task.status = "失败"
+        else:
+            task.status = "已停止" if self.control.cancelled else "完成"
+        self.active_tasks.remove(task)
+        self.finished_tasks += 1
+        if not success: self.failed_tasks += 1
+        self.refresh_task_row(task)
+        if success and len(self.tasks) > 1 and not self.control.cancelled:
+            self.log(f"✅ [{task.index}] 任务完成: {task.url}", "success")
+        
+        self.pump_tasks()
+        if not self.active_tasks and not self.pending_tasks:
+            self.on_finish_success()
 
     def on_finish_success(self):
-        """下载完成处理"""
+        """队列中的任务全部结束"""
+        self.is_running = False
+        self.btn_start.config(text="🚀 开始下载")
+        self.btn_pause.config(state="disabled", text="⏸️ 暂停")
+        self.btn_stop.config(state="disabled")
+        if self.control.cancelled:
+            self.log("\n⏹️ ----------- 任务已停止 -----------", "warning")
+            self.status_var.set("⏹️ 已停止")
+            return
+        if self.failed_tasks == self.finished_tasks:
+            self.status_var.set("🔴 下载失败")
+            return
+        
         self.log("\n✨ ----------- 任务完成 -----------", "success")
-        self.status_var.set("🟢 下载完成")
+        if self.failed_tasks:
+            self.status_var.set(f"🟠 下载完成, {self.failed_tasks} 个任务失败")
+        else:
+            self.status_var.set("🟢 下载完成")
         
-        # 自动打开文件夹
+        # 自动打开文件夹：只有一个任务时打开任务目录，否则打开保存路径
         if self.auto_open_var.get():
-            self.open_file_explorer(self.current_task_dir)
-
-# ================= 核心下载逻辑 =================
-
-class CoreDownloader:
-    def __init__(self, gui, params):
-        self.gui = gui
-        self.start_url = params['url']
-        self.output_dir = params['output_dir']
-        self.max_depth = params['depth']
-        self.mode = params['mode']
-        self.convert_images = params['convert_img']
-        self.target_img_fmt = params['target_fmt']
-        self.allow_img = params['filter_img']
-        self.allow_video = params['filter_video']
-        
-        self.ua = UserAgent()
-        self.visited_urls = set()
-        
-        if not os.path.exists(self.output_dir):
-            os.makedirs(self.output_dir)
-
-        self.media_exts = {
-            'img': ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg'],
-            'video': ['.mp4', '.webm', '.mkv', '.avi', '.mov']
-        }
-
-    def log(self, msg, tag="info"):
-        self.gui.root.after(0, lambda: self.gui.log(msg, tag))
-
-    def get_headers(self):
-        return {'User-Agent': self.ua.random, 'Referer': self.start_url}
-
-    def safe_filename(self, url):
-        path = urlparse(url).path
-        filename = unquote(os.path.basename(path))
-        if not filename or '.' not in filename:
-            filename = f"file_{int(time.time())}.dat"
-        filename = re.sub(r'[\\/*?:"<>|]', "", filename)
-        if len(filename) > 100: filename = filename[-50:]
-        return filename
-
-    def download_resource(self, url, sub_folder):
-        try:
-            is_video = any(url.lower().endswith(ext) for ext in self.media_exts['video'])
-            is_img = any(url.lower().endswith(ext) for ext in self.media_exts['img'])
-            
-            if is_video and not self.allow_video: return None
-            if is_img and not self.allow_img: return None
-            if not is_video and not is_img and self.mode == 'media_only': return None
-
-            folder_path = os.path.join(self.output_dir, sub_folder)
-            if not os.path.exists(folder_path): os.makedirs(folder_path)
-            
-            filename = self.safe_filename(url)
-            local_path = os.path.join(folder_path, filename)
-            relative_path = f"{sub_folder}/{filename}"
-
-            if os.path.exists(local_path): return relative_path
-
-            self.log(f"   ⬇️ {filename}", "info")
-            resp = requests.get(url, headers=self.get_headers(), stream=True, timeout=10, verify=False)
-            
-            if resp.status_code == 200:
-                if is_img and self.convert_images:
-                    try:
-                        img = Image.open(BytesIO(resp.content))
-                        fname_no_ext = os.path.splitext(filename)[0]
-                        new_fname = f"{fname_no_ext}.{self.target_img_fmt.lower()}"
-                        local_path = os.path.join(folder_path, new_fname)
-                        if img.mode in ("RGBA", "P"): img = img.convert("RGB")
-                        img.save(local_path, self.target_img_fmt)
-                        return f"{sub_folder}/{new_fname}"
-                    except Exception as img_error:
-                        self.log(f"   ⚠️ 图片转换失败: {img_error}", "warning")
-
-                with open(local_path, 'wb') as f:
-                    for chunk in resp.iter_content(chunk_size=8192):
-                        f.write(chunk)
-                return relative_path
-            else:
-                self.log(f"   ⚠️ 下载失败: HTTP {resp.status_code}", "warning")
-        except requests.exceptions.ConnectionError as e:
-            self.log(f"   ⚠️ 连接错误: {url}", "warning")
-        except requests.exceptions.Timeout as e:
-            self.log(f"   ⚠️ 超时: {url}", "warning")
-        except Exception as e:
-            self.log(f"   ⚠️ 下载错误: {str(e)}", "warning")
-        return None
-
-    def post_process_html(self, html_content, base_url):
-        """后处理HTML，修复脚本和样式引用"""
-        try:
-            soup = BeautifulSoup(html_content, 'lxml')
-            
-            # 处理script标签
-            for script in soup.find_all('script'):
-                src = script.get('src')
-                if src and not src.startswith('data:'):
-                    abs_url = urljoin(base_url, src)
-                    script_filename = self.safe_filename(abs_url)
-                    script_path = os.path.join(self.output_dir, 'js', script_filename)
-                    
-                    if os.path.exists(script_path):
-                        script['src'] = f"js/{script_filename}"
-                        self.log(f"   🔧 修复脚本引用: {script_filename}", "info")
-                    else:
-                        # 尝试下载缺失的脚本
-                        rel_path = self.download_resource(abs_url, 'js')
-                        if rel_path:
-                            script['src'] = rel_path
-                            self.log(f"   ⬇️ 补充下载脚本: {script_filename}", "info")
-            
-            # 处理link标签（CSS）
-            for link in soup.find_all('link'):
-                href = link.get('href')
-                if href and not href.startswith('data:'):
-                    abs_url = urljoin(base_url, href)
-                    link_filename = self.safe_filename(abs_url)
-                    link_path = os.path.join(self.output_dir, 'css', link_filename)
-                    
-                    if os.path.exists(link_path):
-                        link['href'] = f"css/{link_filename}"
-                        self.log(f"   🔧 修复样式引用: {link_filename}", "info")
-                    else:
-                        # 尝试下载缺失的样式
-                        rel_path = self.download_resource(abs_url, 'css')
-                        if rel_path:
-                            link['href'] = rel_path
-                            self.log(f"   ⬇️ 补充下载样式: {link_filename}", "info")
-            
-            # 处理style标签中的url()引用
-            for style in soup.find_all('style'):
-                if style.string:
-                    style_content = style.string
-                    # 替换url()中的相对路径
-                    import re
-                    def replace_url(match):
-                        url = match.group(1)
-                        if url.startswith('data:'):
-                            return match.group(0)
-                        abs_url = urljoin(base_url, url)
-                        filename = self.safe_filename(abs_url)
-                        # 尝试下载资源
-                        rel_path = self.download_resource(abs_url, 'images')
-                        if rel_path:
-                            return f'url({rel_path})'
-                        return match.group(0)
-                    
-                    style_content = re.sub(r'url\(["\']?([^)"\']+)["\']?\)', replace_url, style_content)
-                    style.string = style_content
-            
-            return str(soup)
-        except Exception as e:
-            self.log(f"   ⚠️ HTML后处理失败: {e}", "warning")
-            return html_content
-
-    def process_page(self, url, depth):
-        if url in self.visited_urls or depth > self.max_depth: return
-        self.visited_urls.add(url)
-        
-        self.log(f"🌍 分析页面 [深度{depth}]: {url}", "info")
-        try:
-            requests.packages.urllib3.disable_warnings()
-            resp = requests.get(url, headers=self.get_headers(), verify=False, timeout=10)
-            if resp.status_code != 200: return
-            
-            soup = BeautifulSoup(resp.text, 'lxml')
-            
-            tags_to_find = [
-                ('img', 'src', 'images'),
-                ('video', 'src', 'videos'),
-                ('source', 'src', 'videos')
-            ]
-            if self.mode == 'full':
-                tags_to_find.extend([('script', 'src', 'js'), ('link', 'href', 'css')])
-
-            futures = []
-            with concurrent.futures.ThreadPoolExecutor(max_workers=6) as executor:
-                for tag_name, attr, folder in tags_to_find:
-                    for tag in soup.find_all(tag_name):
-                        val = tag.get(attr)
-                        if val and not val.startswith('data:'):
-                            abs_url = urljoin(url, val)
-                            f = executor.submit(self.download_resource, abs_url, folder)
-                            futures.append((tag, attr, f))
-
-                if self.mode == 'full':
-                    for tag, attr, f in futures:
-                        rel_path = f.result()
-                        if rel_path: tag[attr] = rel_path
-                    
-                    # 后处理HTML，修复脚本和样式引用
-                    processed_html = self.post_process_html(str(soup), url)
-                    
-                    page_name = self.safe_filename(url)
-                    if not page_name.endswith('.html'): page_name += '.html'
-                    with open(os.path.join(self.output_dir, page_name), 'w', encoding='utf-8') as f:
-                        f.write(processed_html)
-                    self.log(f"✅ 保存页面: {page_name}", "success")
-
-            if depth < self.max_depth:
-                links = soup.find_all('a', href=True)
-                for link in links:
-                    next_url = urljoin(url, link['href'])
-                    if urlparse(next_url).netloc == urlparse(self.start_url).netloc:
-                        self.process_page(next_url, depth + 1)
-
-        except Exception as e:
-            error_msg = f"页面处理错误: {str(e)}"
-            error_details = traceback.format_exc()
-            self.log(f"❌ 页面错误: {e}", "error")
-            
-            # 如果是严重错误，弹出对话框
-            if "ConnectionError" in str(e) or "Timeout" in str(e):
-                self.gui.root.after(0, lambda: ErrorDialog(self.gui.root, "网络错误", error_msg, error_details))
-
-    def start(self):
-        self.process_page(self.start_url, 0)
+            self.open_file_explorer(self.current_task_dir if self.finished_tasks == 1 else self.get_absolute_path())
 
 # ================= 启动 =================
 
 if __name__ == "__main__":
+    # 图片转换使用进程池，打包成 exe 后子进程需要 freeze_support
+    multiprocessing.freeze_support()
     root = tk.Tk()
     try:
         from ctypes import windll